@@ -0,0 +1,126 @@
+from logging import Logger
+from typing import Dict
+from typing import FrozenSet
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from config_check import ConfigCheck
+
+
+class AccessGroups:
+    # `[AccessGroups]` maps a group name to node ids, rules reference a group as `@name`
+    SECTION = "AccessGroups"
+    PREFIX = "@"
+
+    def __init__(self, config: dict, logger: Logger):
+        self._config_check = ConfigCheck(config, self.SECTION, None, logger, optional=True)
+        self._groups: Dict[str, FrozenSet[str]] = {}
+
+        groups = config.get(self.SECTION, {})
+        if not isinstance(groups, dict):
+            self._config_check.fail(f"config error: [{self.SECTION}] must be a table of group name to node ids")
+
+        for name in groups:
+            node_ids = self._config_check.get(name, None, list)
+            if not all(isinstance(n, str) for n in node_ids):
+                self._config_check.fail(f"config error: {self.SECTION}[{name}] must be a list of node ids")
+
+            self._groups[name] = frozenset(node_ids)
+
+    def expand(self, entries: List[str], where: str) -> FrozenSet[str]:
+        node_ids = set()
+        for entry in entries:
+            if not isinstance(entry, str):
+                self._config_check.fail(f"config error: {where} must only contain node ids and @groups")
+
+            if not entry.startswith(self.PREFIX):
+                node_ids.add(entry)
+                continue
+
+            group = self._groups.get(entry[len(self.PREFIX):])
+            if group is None:
+                self._config_check.fail(f"config error: {where} references unknown group '{entry}'")
+
+            node_ids.update(group)
+
+        return frozenset(node_ids)
+
+
+class AccessRule:
+    SCOPES = ("any", "dm", "channel")
+    __slots__ = ("_allow", "_deny", "_channels", "_blocked_channels", "_scope")
+
+    def __init__(
+            self,
+            allow: Optional[FrozenSet[str]] = None,
+            deny: FrozenSet[str] = frozenset(),
+            channels: Optional[int] = None,
+            blocked_channels: int = 0,
+            scope: str = "any"
+    ):
+        # None allows everyone, channels are bitmasks of channel indexes
+        self._allow = allow
+        self._deny = deny
+        self._channels = channels
+        self._blocked_channels = blocked_channels
+        self._scope = scope
+
+    @classmethod
+    def from_config(cls, config: dict, config_check: ConfigCheck) -> "AccessRule":
+        groups = AccessGroups(config, config_check.logger)
+        name = config_check.config_name
+
+        whitelist = config_check.get("whitelist", [], list)
+        blacklist = config_check.get("blacklist", [], list)
+
+        scope = config_check.get("scope", "any", str)
+        if scope not in cls.SCOPES:
+            config_check.fail(f"config error: 'scope' must be one of {', '.join(cls.SCOPES)}")
+
+        channel_whitelist = config_check.get("channel_whitelist", [], list)
+        channel_blacklist = config_check.get("channel_blacklist", [], list)
+
+        return cls(
+            allow=groups.expand(whitelist, f"{name}[whitelist]") if whitelist else None,
+            deny=groups.expand(blacklist, f"{name}[blacklist]"),
+            channels=cls._channel_mask(channel_whitelist, f"{name}[channel_whitelist]", config_check)
+            if channel_whitelist else None,
+            blocked_channels=cls._channel_mask(channel_blacklist, f"{name}[channel_blacklist]", config_check),
+            scope=scope
+        )
+
+    @staticmethod
+    def _channel_mask(channels: List[int], where: str, config_check: ConfigCheck) -> int:
+        mask = 0
+        for channel in channels:
+            if not isinstance(channel, int) or isinstance(channel, bool) or not 0 <= channel <= 7:
+                config_check.fail(f"config error: {where} must only contain channel indexes 0-7")
+
+            mask |= 1 << channel
+
+        return mask
+
+    def check(self, from_id: str, channel: int, is_dm: bool) -> Tuple[bool, str]:
+        # (allowed, reason), the blacklist wins over the whitelist and channel rules only apply outside dms
+        if from_id in self._deny:
+            return False, "blacklisted"
+
+        if self._allow is not None and from_id not in self._allow:
+            return False, "not whitelisted"
+
+        if is_dm:
+            if self._scope == "channel":
+                return False, "channel only"
+
+        else:
+            if self._scope == "dm":
+                return False, "dm only"
+
+            if (1 << channel) & self._blocked_channels:
+                return False, f"channel {channel} blacklisted"
+
+            if self._channels is not None and not (1 << channel) & self._channels:
+                return False, f"channel {channel} not whitelisted"
+
+        return True, "whitelisted" if self._allow is not None else "allowed"
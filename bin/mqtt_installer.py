@@ -1,15 +1,25 @@
 #!/usr/bin/env python
 
 import json
+import os.path
 import re
 import sys
+import threading
 import time
+import tomllib
+import uuid
 from argparse import ArgumentParser
 from argparse import ArgumentTypeError
 from argparse import Namespace
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
 
 import paho.mqtt.client as mqtt
 
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 def validate_node_id(s: str):
     if not re.match(r"^!?[a-f\d]+$", s):
@@ -80,310 +90,222 @@ def read_arg() -> Namespace:
 
     parser.add_argument(
         "--node",
-        dest="node_id",
-        required=True,
+        dest="node_ids",
+        action="append",
+        default=[],
         type=validate_node_id,
-        help="node id(hex) with or without the leading '!'"
+        help="node id(hex) with or without the leading '!', can be repeated"
+    )
+    parser.add_argument(
+        "--config",
+        help="installs the topics of every node in the MqttSubscriber node_ids of a meshEcho.toml"
+    )
+    parser.add_argument(
+        "--node_file",
+        help="installs the topics of every node id listed in the file, one per line"
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="publishes every topic, even when the retained config is unchanged"
+    )
+    parser.add_argument(
+        "--timeout",
+        default=10,
+        type=float,
+        help="seconds to wait for the broker"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="prints the installed payloads"
     )
 
     args = parser.parse_args()
+
+    try:
+        args.node_ids = read_node_ids(args)
+
+    except (ArgumentTypeError, OSError, tomllib.TOMLDecodeError) as e:
+        parser.error(str(e))
+
+    if not args.node_ids:
+        parser.error("no nodes: use --node, --config or --node_file")
+
     return args
 
 
-def device_metrics_discovery(node_id: str):
-    if node_id.startswith("!"):
-        node_id = node_id.lstrip("!")
-
-    state_topic = f"homeassistant/sensor/{node_id}_device_metrics/state"
-    payloads = [
-        {
-            "expire_after": 2400,
-            "min": 0,
-            "max": 101,
-            "device_class": "battery",
-            "state_topic": state_topic,
-            "unit_of_measurement": "%",
-            "value_template": "{{ value_json.batteryLevel | round(0) }}",
-            "name": f"{node_id}_batteryLevel",
-            "object_id": f"{node_id}_batteryLevel",
-            "unique_id": f"{node_id}_batteryLevel",
-            "device": {
-                "identifiers": [f"{node_id}"],
-                "name": f"{node_id}",
-            }
-        },
-        {
-            "expire_after": 2400,
-            "min": 0,
-            "max": 4.40,
-            "device_class": "voltage",
-            "state_topic": state_topic,
-            "unit_of_measurement": "V",
-            "value_template": "{{ value_json.voltage | round(2) }}",
-            "name": f"{node_id}_voltage",
-            "object_id": f"{node_id}_voltage",
-            "unique_id": f"{node_id}_voltage",
-            "device": {
-                "identifiers": [f"{node_id}"],
-                "name": f"{node_id}",
-            }
-        },
-        {
-            "expire_after": 2400,
-            "icon": "mdi:radio-tower",
-            "state_topic": state_topic,
-            "unit_of_measurement": "%",
-            "value_template": "{{ value_json.airUtilTx | round(2) }}",
-            "name": f"{node_id}_airUtilTx",
-            "object_id": f"{node_id}_airUtilTx",
-            "unique_id": f"{node_id}_airUtilTx",
-            "device": {
-                "identifiers": [f"{node_id}"],
-                "name": f"{node_id}",
-            }
-        },
-        {
-            "expire_after": 2400,
-            "icon": "mdi:radio-tower",
-            "state_topic": state_topic,
-            "unit_of_measurement": "%",
-            "value_template": "{{ value_json.channelUtilization | round(2) }}",
-            "name": f"{node_id}_channelUtilization",
-            "object_id": f"{node_id}_channelUtilization",
-            "unique_id": f"{node_id}_channelUtilization",
-            "device": {
-                "identifiers": [f"{node_id}"],
-                "name": f"{node_id}",
-            }
-        },
-    ]
-
-    for payload in payloads:
-        topic_path = [
-            "homeassistant",
-            "sensor",
-            payload["unique_id"],
-            "config"
-        ]
-        discovery_topic = "/".join(topic_path)
-        yield discovery_topic, payload
-
-
-def environment_metrics_discovery(node_id: str):
-    if node_id.startswith("!"):
-        node_id = node_id.lstrip("!")
-
-    state_topic = f"homeassistant/sensor/{node_id}_environment_metrics/state"
-    payloads = [
-        {
-            "expire_after": 2400,
-            "device_class": "temperature",
-            "state_topic": state_topic,
-            "unit_of_measurement": "°C",
-            "value_template": "{{ value_json.temperature | round(1) }}",
-            "name": f"{node_id}_temperature",
-            "object_id": f"{node_id}_temperature",
-            "unique_id": f"{node_id}_temperature",
-            "device": {
-                "identifiers": [f"{node_id}"],
-                "name": f"{node_id}",
-            }
-        },
-        {
-            "expire_after": 2400,
-            "device_class": "humidity",
-            "state_topic": state_topic,
-            "unit_of_measurement": "%",
-            "value_template": "{{ value_json.relativeHumidity | round(0) }}",
-            "name": f"{node_id}_relativeHumidity",
-            "object_id": f"{node_id}_relativeHumidity",
-            "unique_id": f"{node_id}_relativeHumidity",
-            "device": {
-                "identifiers": [f"{node_id}"],
-                "name": f"{node_id}",
-            }
-        },
-        {
-            "expire_after": 2400,
-            "device_class": "humidity",
-            "state_topic": state_topic,
-            "unit_of_measurement": "hPa",
-            "value_template": "{{ value_json.barometricPressure | round(1) }}",
-            "name": f"{node_id}_barometricPressure",
-            "object_id": f"{node_id}_barometricPressure",
-            "unique_id": f"{node_id}_barometricPressure",
-            "device": {
-                "identifiers": [f"{node_id}"],
-                "name": f"{node_id}",
-            }
-        },
-    ]
-
-    for payload in payloads:
-        topic_path = [
-            "homeassistant",
-            "sensor",
-            payload["unique_id"],
-            "config"
-        ]
-        discovery_topic = "/".join(topic_path)
-        yield discovery_topic, payload
-
-
-def position_discovery(node_id: str):
-    if node_id.startswith("!"):
-        node_id = node_id.lstrip("!")
-
-    topic = f"homeassistant/device_tracker/{node_id}_position/config"
-    payload = {
-        "json_attributes_topic": f"homeassistant/device_tracker/{node_id}_position/attributes",
-        "name": f"{node_id}_position",
-        "object_id": f"{node_id}_position",
-        "unique_id": f"{node_id}_position",
-        "device": {
-            "identifiers": [f"{node_id}"],
-            "name": f"{node_id}",
-        }
-    }
-    yield topic, payload
-
-
-def local_stats_discovery(node_id: str):
-    _ = {
-        "numPacketsTx",
-        "numTotalNodes",
-        "uptimeSeconds"
-    }
-
-    if node_id.startswith("!"):
-        node_id = node_id.lstrip("!")
-
-    state_topic = f"homeassistant/sensor/{node_id}_local_stats/state"
-
-    payloads = []
-
-    names = [
-        "numOnlineNodes",
-        "numTotalNodes",
-    ]
-    for name in names:
-        payloads.append(
-            {
-                "expire_after": 1200,
-                "state_topic": state_topic,
-                "unit_of_measurement": "node",
-                "value_template": f"{{{{ value_json.{name} }}}}",
-                "name": f"{node_id}_{name}",
-                "object_id": f"{node_id}_{name}",
-                "unique_id": f"{node_id}_{name}",
-                "device": {
-                    "identifiers": [f"{node_id}"],
-                    "name": f"{node_id}",
-                }
-            }
-        )
-    names = [
-        "numPacketsRx",
-        "numPacketsRxBad",
-        "numPacketsTx",
-    ]
-    for name in names:
-        payloads.append(
-            {
-                "expire_after": 1200,
-                "state_topic": state_topic,
-                "unit_of_measurement": "packet",
-                "value_template": f"{{{{ value_json.{name} }}}}",
-                "name": f"{node_id}_{name}",
-                "object_id": f"{node_id}_{name}",
-                "unique_id": f"{node_id}_{name}",
-                "device": {
-                    "identifiers": [f"{node_id}"],
-                    "name": f"{node_id}",
-                }
-            }
-        )
-
-    for payload in payloads:
-        topic_path = [
-            "homeassistant",
-            "sensor",
-            payload["unique_id"],
-            "config"
-        ]
-        discovery_topic = "/".join(topic_path)
-        yield discovery_topic, payload
-
-
-def install_topic(args: Namespace, mqtt_client: mqtt.Client, topic: str, payload: dict):
-    if args.uninstall:
-        print(f"uninstalling {topic}")
-        mqtt_client.publish(topic, "", qos=1)
-        time.sleep(2)
-
-    else:
-        print(f"installing {topic}")
-        json_payload = json.dumps(payload, sort_keys=True)
-        print(json.dumps(payload, sort_keys=True, indent=0))
-        mqtt_client.publish(topic, json_payload, retain=args.retain, qos=1)
-        time.sleep(2)
+def read_node_ids(args: Namespace) -> List[str]:
+    node_ids = list(args.node_ids)
+
+    if args.config:
+        with open(args.config, "rb") as fd:
+            config = tomllib.load(fd)
+
+        node_ids.extend(validate_node_id(s.lower()) for s in config.get("MqttSubscriber", {}).get("node_ids", []))
+
+    if args.node_file:
+        with open(args.node_file, "r") as fd:
+            for line in fd:
+                line = line.split("#")[0].strip()
+                if line:
+                    node_ids.append(validate_node_id(line.lower()))
+
+    # keeps the order, drops duplicates
+    return list(dict.fromkeys(node_ids))
+
+
+def discovery_topics(args: Namespace, groups: Dict[str, Callable]) -> Dict[str, dict]:
+    discoveries = [discovery for group, discovery in groups.items() if getattr(args, group)]
+
+    topics = {}
+    for node_id in args.node_ids:
+        for discovery in discoveries:
+            topics.update(discovery(node_id))
+
+    return topics
+
+
+def connect(args: Namespace) -> mqtt.Client:
+    connected = threading.Event()
+
+    def on_connect(client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"mqtt broker refused connection: {reason_code}")
+        else:
+            connected.set()
+
+    mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    mqtt_client.username_pw_set(
+        username=args.mqtt_user,
+        password=args.mqtt_pass
+    )
+    mqtt_client.on_connect = on_connect
+    # every publish is queued at once, acknowledgements are awaited at the end
+    mqtt_client.max_inflight_messages_set(100)
+
+    print(f"connecting to mqtt broker: {args.mqtt_host}:{args.mqtt_port}")
+    mqtt_client.connect(args.mqtt_host, args.mqtt_port, 60)
+    mqtt_client.loop_start()
+
+    if not connected.wait(args.timeout):
+        print(f"failed to connect to mqtt broker: {args.mqtt_host}:{args.mqtt_port}")
+        mqtt_client.loop_stop()
+        sys.exit(1)
+
+    print(f"connected to mqtt broker")
+    return mqtt_client
+
+
+def read_retained(args: Namespace, mqtt_client: mqtt.Client, topics: List[str]) -> Optional[Dict[str, bytes]]:
+    # the broker sends the retained messages of a subscription before anything published after it,
+    # so the marker arrives once every retained config has been received
+    marker_topic = f"meshecho/installer/{uuid.uuid4().hex}"
+    received = threading.Event()
+    retained = {}
+
+    def on_message(client, userdata, message):
+        if message.topic == marker_topic:
+            received.set()
+        elif message.retain:
+            retained[message.topic] = message.payload
+
+    mqtt_client.on_message = on_message
+    mqtt_client.subscribe([(topic, 1) for topic in topics] + [(marker_topic, 1)])
+    mqtt_client.publish(marker_topic, "", qos=1)
+
+    timed_out = not received.wait(args.timeout)
+    mqtt_client.unsubscribe(topics + [marker_topic])
+    mqtt_client.on_message = None
+
+    if timed_out:
+        print("timed out reading the retained topics, publishing every topic")
+        return None
+
+    return dict(retained)
+
+
+def is_installed(retained: Dict[str, bytes], topic: str, payload: dict) -> bool:
+    try:
+        return json.loads(retained[topic]) == payload
+
+    except (KeyError, ValueError):
+        return False
+
+
+def install_topics(
+        args: Namespace,
+        mqtt_client: mqtt.Client,
+        topics: Dict[str, dict],
+        retained: Optional[Dict[str, bytes]]
+):
+    # without the retained topics, when forced or the read timed out, every topic is published
+    pending = []
+    unchanged = 0
+    for topic, payload in topics.items():
+        if args.uninstall:
+            if retained is not None and topic not in retained:
+                unchanged += 1
+                continue
+
+            print(f"uninstalling {topic}")
+            pending.append((topic, mqtt_client.publish(topic, "", retain=True, qos=1)))
+
+        else:
+            if retained is not None and args.retain and is_installed(retained, topic, payload):
+                unchanged += 1
+                continue
+
+            print(f"installing {topic}")
+            if args.verbose:
+                print(json.dumps(payload, sort_keys=True, indent=0))
+
+            json_payload = json.dumps(payload, sort_keys=True)
+            pending.append((topic, mqtt_client.publish(topic, json_payload, retain=args.retain, qos=1)))
+
+    deadline = time.monotonic() + args.timeout
+    failed = 0
+    for topic, info in pending:
+        try:
+            info.wait_for_publish(max(0.0, deadline - time.monotonic()))
+
+        except (RuntimeError, ValueError) as e:
+            print(f"failed to publish {topic}: {e}")
+
+        if not info.is_published():
+            failed += 1
+
+    print(f"published {len(pending) - failed}/{len(pending)} topics, {unchanged} unchanged")
+    if failed:
+        sys.exit(1)
 
 
 def main():
+    # the repo modules are only importable once the repo root is on the path
+    sys.path.insert(0, REPO_ROOT)
+    from discovery import DISCOVERIES
+
     args = read_arg()
 
+    topics = discovery_topics(args, DISCOVERIES)
+    if not topics:
+        print("no topics selected: use --device_metrics, --environment_metrics, --local_stats or --position")
+        sys.exit(1)
+
+    print(f"{len(topics)} topics for {len(args.node_ids)} nodes")
+
     mqtt_client = None
     try:
-        mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        mqtt_client.username_pw_set(
-            # username="mesht_mqtt",
-            # password="4s8PcqG1S@Ps"
-            username=args.mqtt_user,
-            password=args.mqtt_pass
-        )
-        # mqtt_client.connect("10.3.0.51", args.mqtt_port, 60)
-        mqtt_client.connect(args.mqtt_host, args.mqtt_port, 60)
-        mqtt_client.loop_start()
-
-        for i in range(5):
-            print(f"{i + 1}/5: connecting to mqtt broker: {args.mqtt_host}:{args.mqtt_port}")
-            time.sleep(1)
-            if mqtt_client.is_connected():
-                break
-
-        if not mqtt_client.is_connected():
-            print(f"filed to connect to mqtt broker: {args.mqtt_host}:{args.mqtt_port}")
-            sys.exit(1)
-
-        print(f"connected to mqtt broker")
-
-        node_id = args.node_id
-
-        if args.device_metrics:
-            print(f"{node_id} device metrics")
-            for topic, payload in device_metrics_discovery(node_id):
-                install_topic(args, mqtt_client, topic, payload)
-
-        if args.environment_metrics:
-            print(f"{node_id} environment metrics")
-            for topic, payload in environment_metrics_discovery(node_id):
-                install_topic(args, mqtt_client, topic, payload)
-
-        if args.local_stats:
-            print(f"{node_id} local stats")
-            for topic, payload in local_stats_discovery(node_id):
-                install_topic(args, mqtt_client, topic, payload)
-
-        if args.position:
-            print(f"{node_id} position")
-            for topic, payload in position_discovery(node_id):
-                install_topic(args, mqtt_client, topic, payload)
-
-    except Exception as e:
-        raise e
+        mqtt_client = connect(args)
+
+        retained = None if args.force else read_retained(args, mqtt_client, list(topics))
+        install_topics(args, mqtt_client, topics, retained)
+
     finally:
         if mqtt_client:
             mqtt_client.disconnect()
+            mqtt_client.loop_stop()
 
 
 if __name__ == '__main__':
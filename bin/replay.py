@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import os.path
+import sys
+import threading
+import time
+import tomllib
+from argparse import ArgumentParser
+from argparse import ArgumentTypeError
+from argparse import Namespace
+from collections import Counter
+from collections import defaultdict
+
+from meshtastic import BROADCAST_NUM
+from pubsub import pub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def is_file(s: str):
+    if not os.path.isfile(s):
+        raise ArgumentTypeError(f"{s} is not a file")
+
+    return s
+
+
+def read_arg() -> Namespace:
+    parser = ArgumentParser(description="replays recorded packets through the subscribers")
+
+    parser.add_argument(
+        "packets",
+        type=is_file,
+        help="jsonl file written by RecorderSubscriber"
+    )
+    parser.add_argument(
+        "-c", "--config",
+        default="meshEcho.toml",
+        type=is_file
+    )
+    parser.add_argument(
+        "--speed",
+        default=0,
+        type=float,
+        help="replay speed relative to the recording, 0 (default) replays as fast as possible"
+    )
+    parser.add_argument(
+        "--repeat",
+        default=1,
+        type=int,
+        help="number of times the recording is replayed"
+    )
+    parser.add_argument(
+        "--local_node",
+        default=None,
+        help="node id of the bot, defaults to the most common direct message destination"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="shows subscriber logging"
+    )
+
+    return parser.parse_args()
+
+
+class FakeLocalNode:
+    def __init__(self, node_num: int):
+        self.nodeNum = node_num
+
+
+class FakeInterface:
+    def __init__(self, node_num: int, nodes: dict):
+        self.localNode = FakeLocalNode(node_num)
+        self.nodes = nodes
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def sendText(self, text: str, destinationId=BROADCAST_NUM, wantAck=False, channelIndex=0, **kwargs):
+        with self._lock:
+            self.sent += 1
+
+
+class FakeMqttClient:
+    class Info:
+        rc = 0
+
+        @staticmethod
+        def is_published():
+            return True
+
+        @staticmethod
+        def wait_for_publish(timeout=None):
+            return True
+
+    def __init__(self):
+        self.published = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_connected():
+        return True
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False):
+        with self._lock:
+            self.published += 1
+
+        return self.Info()
+
+
+class TimedListener:
+    # stands in for the subscriber behind the PacketRouter
+    def __init__(self, name: str, listener, latencies: dict):
+        self._name = name
+        self._listener = listener
+        self._latencies = latencies[name]
+
+    @property
+    def logger(self):
+        return self._listener.logger
+
+    @property
+    def portnums(self):
+        return self._listener.portnums
+
+    @property
+    def from_ids(self):
+        return self._listener.from_ids
+
+    def route(self, packet: dict, interface, portnum, from_id):
+        start = time.perf_counter()
+        self._listener.route(packet, interface, portnum, from_id)
+        self._latencies.append(time.perf_counter() - start)
+
+
+def load_packets(path: str, decode) -> list:
+    records = []
+    with open(path, "r", encoding="utf-8") as fd:
+        for line in fd:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                record["packet"] = decode(record["packet"])
+                records.append(record)
+
+    return records
+
+
+def build_nodes(records: list) -> dict:
+    nodes = {}
+    for record in records:
+        packet = record["packet"]
+        user = packet.get("decoded", {}).get("user")
+        if user and "id" in user:
+            nodes[user["id"]] = {"num": packet["from"], "user": user}
+
+    return nodes
+
+
+def guess_local_node(records: list) -> int:
+    destinations = Counter(
+        r["packet"].get("to") for r in records if r["packet"].get("to") not in (None, BROADCAST_NUM)
+    )
+    return destinations.most_common(1)[0][0] if destinations else 0
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(name: str, values: list):
+    values = sorted(values)
+    total = sum(values)
+    print(
+        f"{name:<20} n={len(values):<8} "
+        f"p50={percentile(values, 50) * 1e6:9.1f}us "
+        f"p95={percentile(values, 95) * 1e6:9.1f}us "
+        f"p99={percentile(values, 99) * 1e6:9.1f}us "
+        f"max={(values[-1] if values else 0) * 1e6:9.1f}us "
+        f"total={total:.3f}s"
+    )
+
+
+def report_histogram(name: str, histogram):
+    # the executor's latency histograms only have bucket bounds, quantiles are upper bounds
+    print(
+        f"{name:<20} n={histogram.count:<8} "
+        f"p50<={histogram.quantile(0.50) * 1e6:8.1f}us "
+        f"p95<={histogram.quantile(0.95) * 1e6:8.1f}us "
+        f"p99<={histogram.quantile(0.99) * 1e6:8.1f}us "
+        f"{'':15}total={histogram.sum:.3f}s"
+    )
+
+
+def main():
+    # the repo modules are only importable once the repo root is on the path
+    sys.path.insert(0, REPO_ROOT)
+    from metrics import metrics
+    from node_directory import node_directory
+    from subscriber import CmdSubscriber
+    from subscriber import MqttSubscriber
+    from subscriber import PacketRouter
+    from subscriber import RecorderSubscriber
+
+    args = read_arg()
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.ERROR,
+        format='%(asctime)s %(levelname).1s %(name)-20s:%(message)s',
+        datefmt='%Y-%m-%dT%H:%M:%S'
+    )
+
+    with open(args.config, "rb") as fd:
+        config = tomllib.load(fd)
+
+    records = load_packets(args.packets, RecorderSubscriber.decode)
+    if not records:
+        print(f"no packets in {args.packets}")
+        sys.exit(1)
+
+    if args.local_node:
+        local_node = int(args.local_node.lstrip("!"), 16)
+    else:
+        local_node = guess_local_node(records)
+
+    interface = FakeInterface(local_node, build_nodes(records))
+    mqtt_client = FakeMqttClient()
+    latencies = defaultdict(list)
+
+    node_directory.pubsub_subscribe()
+
+    subscribers = []
+    if MqttSubscriber.__name__ in config:
+        # announcements only reach the fake client, they must not be recorded in the live bot's discovery state
+        config[MqttSubscriber.__name__] = {**config[MqttSubscriber.__name__], "discovery_state": ""}
+        subscribers.append(MqttSubscriber(config, mqtt_client))
+    if CmdSubscriber.__name__ in config:
+        subscribers.append(CmdSubscriber(config))
+
+    # packets take the same path as in meshEcho.py, deduplicated and routed once
+    if args.repeat > 1:
+        # every repeat would be a duplicate of the first one
+        config["PacketRouter"] = {**config.get("PacketRouter", {}), "window": 0}
+
+    listeners = [TimedListener(s.__class__.__name__, s, latencies) for s in subscribers]
+    router = PacketRouter(config, listeners)
+    router.pubsub_subscribe()
+
+    print(f"replaying {len(records)} packets x{args.repeat} at {args.speed or 'max'} speed, local node {local_node:x}")
+
+    dispatch = []
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        first = records[0]["time"]
+        replay_start = time.perf_counter()
+        for record in records:
+            if args.speed:
+                delay = (record["time"] - first) / args.speed - (time.perf_counter() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            begin = time.perf_counter()
+            pub.sendMessage(record["topic"], packet=record["packet"], interface=interface)
+            dispatch.append(time.perf_counter() - begin)
+
+    dispatched = time.perf_counter() - start
+
+    # let queued command work finish
+    executor_stats = None
+    for subscriber in subscribers:
+        if isinstance(subscriber, CmdSubscriber):
+            while True:
+                executor_stats = subscriber.executor.stats()
+                if not executor_stats["queue_depth"] and not executor_stats["running"]:
+                    break
+
+                time.sleep(0.01)
+
+    elapsed = time.perf_counter() - start
+
+    packet_count = len(records) * args.repeat
+    print(f"dispatched {packet_count} packets in {dispatched:.3f}s: {packet_count / dispatched:.0f} packets/s")
+    print(f"drained in {elapsed:.3f}s: {packet_count / elapsed:.0f} packets/s")
+    print(f"replies sent {interface.sent}, mqtt publishes {mqtt_client.published}")
+    if executor_stats:
+        print(
+            f"commands completed {executor_stats['completed']}, dropped {executor_stats['dropped']}, "
+            f"rejected {executor_stats['rejected']}, max queue depth {executor_stats['queue_max_depth']}, "
+            f"max wait {executor_stats['wait_max'] * 1e3:.1f}ms"
+        )
+    report("dispatch", dispatch)
+    for name, values in latencies.items():
+        report(name, values)
+
+    # CmdSubscriber's handler only parses and enqueues, the cmds run on the executor
+    for labels, histogram in sorted(metrics.find("cmd_latency_seconds").items()):
+        report_histogram(f"cmd {dict(labels)['cmd']}", histogram)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,13 @@
 from .base import BaseCmd
-from .echo import EchoCmd
-from .man import ManCmd
-from .noaa import NoaaCmd
-from .ping import PingCmd
-from .roll import RollCmd
-from .top import TopCmd
+from .dispatch import CmdDispatcher
+from .executor import CmdExecutor
+from .registry import CmdRegistry
+from .registry import cmd_registry
+
+
+def __getattr__(name: str):
+    # commands are imported on first use, see CmdRegistry
+    if name in CmdRegistry.BUILTIN_CMDS:
+        return cmd_registry.load(name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
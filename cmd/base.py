@@ -1,17 +1,30 @@
 import logging
+import re
+import time
 from datetime import timedelta
 from logging import Logger
+from typing import Hashable
 from typing import List
+from typing import Optional
+from typing import Tuple
 
 from meshtastic import BROADCAST_NUM
 from meshtastic.mesh_interface import MeshInterface
 
+from acl import AccessRule
 from config_check import ConfigCheck
 from interface_utils import get_long_name
 from interface_utils import get_short_name
+from metrics import metrics
+from rate_limiter import RateLimiter
+from send_scheduler import SendScheduler
+from ttl_cache import TtlCache
 
 
 class BaseCmd:
+    # used when no scheduler is bound
+    MAX_PAYLOAD = 200
+    _SEGMENT_PATTERN = re.compile(r"(\s*)(\S+)")
 
     def __init__(self, key: str, config: dict):
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -24,27 +37,98 @@ class BaseCmd:
             self.logger
         )
 
-        self._blacklist = config_check.get("blacklist", [], list).copy()
-        self._whitelist = config_check.get("whitelist", [], list).copy()
-        if self._blacklist and self._whitelist:
-            self.logger.error(f"config error: 'blacklist' and 'whitelist' are mutually exclusive")
-            exit(1)
+        self._access_rule = AccessRule.from_config(config, config_check)
 
-        self._config = config_check
+        self._max_concurrency = config_check.get("max_concurrency", 0, int)
+
+        priority = config_check.get("priority", "normal", str)
+        if priority not in SendScheduler.PRIORITIES:
+            config_check.fail(f"config error: 'priority' must be one of {', '.join(SendScheduler.PRIORITIES)}")
+
+        self._priority = SendScheduler.PRIORITIES[priority]
+        self._scheduler = None
+
+        self._rate_limiter = RateLimiter.from_config(config_check)
 
-    def check_access(self, from_id: str) -> bool:
-        if not self._blacklist and not self._whitelist:
-            return True
-        elif from_id not in self._blacklist:
-            return True
-        elif from_id in self._whitelist:
-            return True
+        # replies are reused for `reply_cache_ttl` seconds, keyed by cache_key()
+        reply_cache_ttl = config_check.get("reply_cache_ttl", 0, (int, float))
+        if reply_cache_ttl > 0:
+            self._reply_cache = TtlCache(ttl=reply_cache_ttl, max_size=config_check.get("reply_cache_size", 64, int))
         else:
-            return False
+            self._reply_cache = None
+
+        self._metric_invocations = metrics.counter("cmd_invocations_total", "command invocations", cmd=key)
+        self._metric_errors = metrics.counter("cmd_errors_total", "command invocations that raised", cmd=key)
+        self._metric_latency = metrics.histogram("cmd_latency_seconds", "command handler latency", cmd=key)
+
+        self._config = config_check
 
-    def __call__(self, escape: str, packet: dict, interface: MeshInterface):
+    def register_metrics(self):
+        # gauges are bound once the cmd is in use, a cmd built by a rejected reload never replaces the running ones
+        if self._reply_cache is not None:
+            metrics.gauge("cmd_reply_cache_hits", "reply cache hits", lambda: self._reply_cache.hits, cmd=self.key)
+            metrics.gauge("cmd_reply_cache_misses", "reply cache misses", lambda: self._reply_cache.misses, cmd=self.key)
+
+    def unregister_metrics(self):
+        if self._reply_cache is not None:
+            metrics.remove_gauge("cmd_reply_cache_hits", cmd=self.key)
+            metrics.remove_gauge("cmd_reply_cache_misses", cmd=self.key)
+
+    @property
+    def rate_limiter(self) -> Optional[RateLimiter]:
+        return self._rate_limiter
+
+    @property
+    def reply_cache(self) -> Optional[TtlCache]:
+        return self._reply_cache
+
+    @property
+    def access_rule(self) -> AccessRule:
+        return self._access_rule
+
+    def check_access(self, packet: dict, interface: MeshInterface) -> Tuple[bool, str]:
+        return self._access_rule.check(
+            packet["fromId"],
+            packet.get("channel", 0),
+            self.is_packet_dm(packet, interface)
+        )
+
+    def reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
         raise NotImplementedError()
 
+    def cache_key(self, escape: str, packet: dict, args: str) -> Hashable:
+        return packet.get("fromId"), args
+
+    def cached_reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
+        if self._reply_cache is None:
+            return self.reply(escape, packet, interface, args)
+
+        key = self.cache_key(escape, packet, args)
+        replies = self._reply_cache.get(key)
+        if replies is None:
+            replies = self.reply(escape, packet, interface, args)
+            self._reply_cache.put(key, tuple(replies))
+
+        return list(replies)
+
+    def __call__(self, escape: str, packet: dict, interface: MeshInterface, args: str):
+        replies = self.cached_reply(escape, packet, interface, args)
+        if replies:
+            self.send_reply(replies, packet, interface)
+
+    def invoke(self, escape: str, packet: dict, interface: MeshInterface, args: str):
+        start = time.perf_counter()
+        self._metric_invocations.inc()
+        try:
+            self(escape, packet, interface, args)
+
+        except Exception:
+            self._metric_errors.inc()
+            raise
+
+        finally:
+            self._metric_latency.observe(time.perf_counter() - start)
+
     @property
     def logger(self) -> Logger:
         return self._logger
@@ -53,6 +137,22 @@ class BaseCmd:
     def key(self) -> str:
         return self._key
 
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def scheduler(self) -> Optional[SendScheduler]:
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler: Optional[SendScheduler]):
+        self._scheduler = scheduler
+
+    @property
+    def max_payload(self) -> int:
+        return self._scheduler.max_payload if self._scheduler is not None else self.MAX_PAYLOAD
+
     def help_line(self, escape: str) -> str:
         return f"{escape}{self.key}"
 
@@ -60,19 +160,23 @@ class BaseCmd:
     def is_packet_dm(packet: dict, interface: MeshInterface) -> bool:
         return packet["to"] == interface.localNode.nodeNum
 
-    @staticmethod
-    def send_reply_dm(replies: List[str], packet: dict, interface: MeshInterface):
+    def _send_text(self, text: str, interface: MeshInterface, destination_id, channel_index: int = 0):
+        if self._scheduler is not None:
+            self._scheduler.send(interface, text, destination_id, channel_index, self._priority)
+
+        else:
+            interface.sendText(text, destinationId=destination_id, channelIndex=channel_index, wantAck=False)
+
+    def send_reply_dm(self, replies: List[str], packet: dict, interface: MeshInterface):
         from_id = packet["fromId"]
         for reply in replies:
-            interface.sendText(reply, destinationId=from_id, wantAck=False)
+            self._send_text(reply, interface, from_id)
 
-    @staticmethod
-    def send_reply_channel(replies: List[str], packet: dict, interface: MeshInterface):
+    def send_reply_channel(self, replies: List[str], packet: dict, interface: MeshInterface):
         channel_index = packet.get("channel", 0)
 
         for reply in replies:
-            interface.sendText(
-                reply, channelIndex=channel_index, destinationId=BROADCAST_NUM, wantAck=False)
+            self._send_text(reply, interface, BROADCAST_NUM, channel_index)
 
     def log_reply(self, replies: List[str], packet: dict, interface: MeshInterface):
         from_id = packet["fromId"]
@@ -81,28 +185,108 @@ class BaseCmd:
         self.logger.info(f"from {name}: '{self.get_text(packet)}' -> '{reply}'")
 
     def send_reply(self, replies: List[str], packet: dict, interface: MeshInterface):
+        packets = self.fragment(
+            "\n".join(replies),
+            self.max_payload,
+            self.channel_prefix(packet, interface)
+        )
 
         if self.is_packet_dm(packet=packet, interface=interface):
             self.send_reply_dm(
-                replies,
+                packets,
                 interface=interface,
                 packet=packet
             )
         else:
             self.send_reply_channel(
-                replies,
+                packets,
                 interface=interface,
                 packet=packet
             )
 
         self.log_reply(replies, packet, interface)
 
-    def apply_channel_prefix(self, packet: dict, interface: MeshInterface, text: str) -> str:
+    def channel_prefix(self, packet: dict, interface: MeshInterface) -> str:
         if self.is_packet_dm(packet, interface):
-            return text
+            return ""
 
         else:
-            return f"{self.reply_prefix(packet, interface)}\n{text}"
+            return f"{self.reply_prefix(packet, interface)}\n"
+
+    @classmethod
+    def fragment(cls, text: str, max_payload: int, prefix: str = "") -> List[str]:
+        # packs text into the fewest packets of at most max_payload utf-8 bytes,
+        # splitting on whitespace; the prefix is only sent with the first packet
+        # and fragments are numbered "[i/n] " when there is more than one
+        segments = [
+            (separator, word, len(separator.encode("utf-8")), len(word.encode("utf-8")))
+            for separator, word in cls._SEGMENT_PATTERN.findall(text)
+        ]
+
+        first_prefix = cls._truncate(prefix, max_payload)
+        packets = cls._pack(segments, max_payload - len(first_prefix.encode("utf-8")), max_payload)
+        if len(packets) <= 1:
+            return [first_prefix + "".join(packets)]
+
+        # reserve room for the marker, repacking if the count gains a digit
+        width = len(str(len(packets)))
+        while True:
+            marker_size = 2 * width + 4
+            first_prefix = cls._truncate(prefix, max_payload - marker_size)
+            packets = cls._pack(
+                segments,
+                max_payload - len(first_prefix.encode("utf-8")) - marker_size,
+                max_payload - marker_size
+            )
+            if len(str(len(packets))) <= width:
+                break
+
+            width += 1
+
+        count = len(packets)
+        packets[0] = first_prefix + packets[0]
+        return [f"[{index + 1}/{count}] {packet}" for index, packet in enumerate(packets)]
+
+    @staticmethod
+    def _truncate(text: str, size: int) -> str:
+        return text.encode("utf-8")[:max(size, 0)].decode("utf-8", "ignore")
+
+    @classmethod
+    def _pack(cls, segments: list, first_capacity: int, capacity: int) -> List[str]:
+        packets, buf, used, limit = [], [], 0, first_capacity
+        for separator, word, separator_size, word_size in segments:
+            if buf and used + separator_size + word_size <= limit:
+                buf.extend((separator, word))
+                used += separator_size + word_size
+                continue
+
+            if buf:
+                packets.append("".join(buf))
+                buf, used, limit = [], 0, capacity
+
+            # a single word longer than a packet is split on character boundaries
+            while word_size > limit:
+                head = cls._truncate(word, limit)
+                if not head:
+                    if packets or limit == capacity:
+                        raise ValueError(f"{capacity} bytes per packet can't hold a character")
+
+                    # the prefix filled the first packet, it goes out on its own
+                    packets.append("")
+                    limit = capacity
+                    continue
+
+                packets.append(head)
+                word = word[len(head):]
+                word_size = len(word.encode("utf-8"))
+                limit = capacity
+
+            buf, used = [word], word_size
+
+        if buf:
+            packets.append("".join(buf))
+
+        return packets
 
     def reply_prefix(self, packet: dict, interface: MeshInterface) -> str:
         name = get_short_name(interface, packet["fromId"])
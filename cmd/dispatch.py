@@ -0,0 +1,49 @@
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .base import BaseCmd
+
+# trie node key holding the command that terminates at that node
+_CMD = None
+
+
+class CmdDispatcher:
+
+    def __init__(self, escape: str, cmds: List[BaseCmd]):
+        self._escape = escape
+        self._trie = {}
+
+        for cmd in cmds:
+            node = self._trie
+            for c in cmd.key:
+                node = node.setdefault(c, {})
+
+            node[_CMD] = cmd
+
+    @property
+    def escape(self) -> str:
+        return self._escape
+
+    def parse(self, text: str) -> Optional[Tuple[BaseCmd, str]]:
+        text = text.lstrip()
+        if not text.startswith(self._escape):
+            return None
+
+        # walk the trie once, remembering the longest key that matched;
+        # cost is bounded by the longest key, not by the number of commands
+        match, end = None, 0
+        node = self._trie
+        for index in range(len(self._escape), len(text)):
+            node = node.get(text[index])
+            if node is None:
+                break
+
+            cmd = node.get(_CMD)
+            if cmd is not None:
+                match, end = cmd, index + 1
+
+        if match is None:
+            return None
+
+        return match, text[end:].strip()
@@ -1,3 +1,5 @@
+from typing import List
+
 from meshtastic.mesh_interface import MeshInterface
 
 from interface_utils import get_long_name
@@ -18,13 +20,12 @@ class EchoCmd(BaseCmd):
     def _sanitize_text(text: str) -> str:
         return " ".join(text.split())
 
-    def __call__(self, escape: str, packet: dict, interface: MeshInterface):
-        text = self.get_text(packet).strip().lstrip(f"{escape}{self.key}").strip()
-        if text:
-            text = self.apply_channel_prefix(packet, interface, text)
-            self.send_reply([text], packet, interface)
+    def reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
+        if args:
+            return [args]
 
         else:
             from_id = packet["fromId"]
             from_name = get_long_name(interface, from_id)
-            self.logger.info(f"from {from_name}: '{text}' -> empty body, dropping")
+            self.logger.info(f"from {from_name}: '{self.get_text(packet)}' -> empty body, dropping")
+            return []
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from collections import deque
+from logging import Logger
+from typing import Callable
+
+from metrics import metrics
+from .base import BaseCmd
+
+
+class CmdExecutor:
+    DROP_OLDEST = "drop_oldest"
+    REJECT = "reject"
+    POLICIES = (DROP_OLDEST, REJECT)
+
+    def __init__(self, workers: int, queue_size: int, policy: str = DROP_OLDEST, logger: Logger = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"unsupported queue policy: {policy}")
+
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._workers = max(1, workers)
+        self._queue_size = max(1, queue_size)
+        self._policy = policy
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._running = defaultdict(int)
+        self._threads = []
+        self._stopped = False
+
+        self._submitted = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._completed = 0
+        self._max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        self._metric_dropped = metrics.counter("cmd_queue_dropped_total", "commands dropped from a full queue")
+        self._metric_rejected = metrics.counter("cmd_queue_rejected_total", "commands rejected by a full queue")
+        self._metric_wait = metrics.histogram("cmd_queue_wait_seconds", "time commands waited for a worker")
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    def register_metrics(self):
+        metrics.gauge("cmd_queue_depth", "commands waiting for a worker", lambda: len(self._queue))
+
+    def unregister_metrics(self):
+        metrics.remove_gauge("cmd_queue_depth")
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        with self._cond:
+            self._stopped = False
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(
+                    target=self._worker,
+                    name=f"{self.__class__.__name__}-{len(self._threads)}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+        self.logger.info(f"started {self._workers} workers, queue size {self._queue_size}, policy {self._policy}")
+
+    def stop(self, timeout: float = None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+        self._threads.clear()
+
+    def submit(self, cmd: BaseCmd, call: Callable[[], None]) -> bool:
+        dropped = None
+        with self._cond:
+            if len(self._queue) >= self._queue_size:
+                if self._policy == self.REJECT:
+                    self._rejected += 1
+                    self._metric_rejected.inc()
+                    self.logger.warning(f"queue full ({len(self._queue)}), rejecting {cmd.key}")
+                    return False
+
+                dropped, _, _ = self._queue.popleft()
+                self._dropped += 1
+                self._metric_dropped.inc()
+
+            self._queue.append((cmd, call, time.monotonic()))
+            self._submitted += 1
+            self._max_depth = max(self._max_depth, len(self._queue))
+            self._cond.notify()
+
+        if dropped is not None:
+            self.logger.warning(f"queue full ({self._queue_size}), dropped oldest {dropped.key}")
+
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            started = self._completed + sum(self._running.values())
+            return {
+                "queue_depth": len(self._queue),
+                "queue_max_depth": self._max_depth,
+                "running": sum(self._running.values()),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "dropped": self._dropped,
+                "rejected": self._rejected,
+                "wait_avg": self._wait_total / started if started else 0.0,
+                "wait_max": self._wait_max,
+            }
+
+    def _next_job(self):
+        # oldest job whose command is below its concurrency limit
+        for index, (cmd, call, enqueued) in enumerate(self._queue):
+            limit = cmd.max_concurrency
+            if not limit or self._running[cmd] < limit:
+                del self._queue[index]
+                return cmd, call, enqueued
+
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._stopped:
+                        return
+
+                    self._cond.wait()
+                    job = self._next_job()
+
+                cmd, call, enqueued = job
+                self._running[cmd] += 1
+
+                wait = time.monotonic() - enqueued
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                depth = len(self._queue)
+
+            self._metric_wait.observe(wait)
+            self.logger.debug(f"running {cmd.key} after {wait * 1000:.0f}ms, queue depth {depth}")
+            try:
+                call()
+
+            except Exception:
+                cmd.logger.exception(f"{cmd.key} failed")
+
+            finally:
+                with self._cond:
+                    self._running[cmd] -= 1
+                    self._completed += 1
+                    self._cond.notify_all()
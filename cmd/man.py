@@ -1,4 +1,4 @@
-import re
+from typing import Hashable
 from typing import List
 
 from meshtastic.mesh_interface import MeshInterface
@@ -19,17 +19,16 @@ class ManCmd(BaseCmd):
         cmds = " ".join(sorted(self._cmd_mapping.keys()))
         return f"{super().help_line(escape)}: list available cmd: {cmds}"
 
-    def __call__(self, escape: str, packet: dict, interface: MeshInterface):
-        text = self.get_text(packet)
+    def cache_key(self, escape: str, packet: dict, args: str) -> Hashable:
+        words = args.split()
+        return words[0].removeprefix(escape) if words else None
 
+    def reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
         man_text = None
-        for cmd, help_line in self._cmd_mapping.items():
-            if re.match(rf"^\s*{escape}{self.key}\s+({escape})?{cmd}.*", text):
-                man_text = help_line
-                break
+        if args:
+            man_text = self._cmd_mapping.get(args.split()[0].removeprefix(escape))
 
         if not man_text:
             man_text = self.help_line(escape)
 
-        man_text = self.apply_channel_prefix(packet, interface, man_text)
-        self.send_reply([man_text], packet, interface)
+        return [man_text]
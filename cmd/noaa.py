@@ -1,10 +1,16 @@
 import json
-from typing import Optional
-from urllib.parse import urlunsplit, urlencode
+from typing import List
+from typing import Tuple
+from urllib.error import HTTPError
+from urllib.parse import urlsplit, urlunsplit, urlencode
+from urllib.request import Request
 from urllib.request import urlopen
 
 from meshtastic.mesh_interface import MeshInterface
 
+from metrics import metrics
+from node_directory import node_directory
+from ttl_cache import TtlCache
 from .base import BaseCmd
 
 
@@ -12,44 +18,115 @@ class NoaaCmd(BaseCmd):
     def __init__(self, config: dict):
         super().__init__(key="noaa", config=config)
 
+        self._api_url = urlsplit(self._config.get("api_url", "https://api.weather.gov", str))
+        self._user_agent = self._config.get("user_agent", "meshEcho", str)
+
+        # alerts are cached per grid cell of `cache_grid` degrees
+        self._cache_grid = self._config.get("cache_grid", 0.1, (int, float))
+        if self._cache_grid <= 0:
+            self._config.fail(f"config error: 'cache_grid' must be positive")
+
+        self._cache = TtlCache(
+            ttl=self._config.get("cache_ttl", 300, int),
+            max_size=self._config.get("cache_size", 256, int)
+        )
+        self._fetches = 0
+        self._revalidations = 0
+
         self.logger.info(f"cmd enabled: {self.__class__.__name__}")
 
-    def help_line(self, escape: str) -> str:
-        return f"{super().help_line(escape)}: reports NOAA alerts around your QTH"
+    def register_metrics(self):
+        super().register_metrics()
+        metrics.gauge("cache_hits", "response cache hits", lambda: self._cache.hits, cache="noaa")
+        metrics.gauge("cache_misses", "response cache misses", lambda: self._cache.misses, cache="noaa")
 
-    @staticmethod
-    def _get_alerts(latitude: float, longitude: float):
-        path = "/alerts/active"
-        query = urlencode({"point": f"{latitude},{longitude}"})
-        url = urlunsplit(("https", "api.weather.gov", path, query, ""))
+    def unregister_metrics(self):
+        super().unregister_metrics()
+        metrics.remove_gauge("cache_hits", cache="noaa")
+        metrics.remove_gauge("cache_misses", cache="noaa")
 
-        with urlopen(url) as fd:
-            data = json.load(fd)
+    def help_line(self, escape: str) -> str:
+        return f"{super().help_line(escape)}: reports NOAA alerts around your QTH"
 
+    @property
+    def cache(self) -> TtlCache:
+        return self._cache
+
+    def cache_stats(self) -> dict:
+        stats = self._cache.stats()
+        stats["fetches"] = self._fetches
+        stats["revalidations"] = self._revalidations
+        return stats
+
+    def _grid_cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return round(latitude / self._cache_grid), round(longitude / self._cache_grid)
+
+    def _fetch_alerts(self, latitude: float, longitude: float, etag: str = None, last_modified: str = None):
+        path = f"{self._api_url.path.rstrip('/')}/alerts/active"
+        query = urlencode({"point": f"{latitude:.4f},{longitude:.4f}"})
+        url = urlunsplit((self._api_url.scheme, self._api_url.netloc, path, query, ""))
+
+        headers = {
+            "Accept": "application/geo+json",
+            "User-Agent": self._user_agent,
+        }
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        self._fetches += 1
+        try:
+            with urlopen(Request(url, headers=headers)) as fd:
+                data = json.load(fd)
+                etag = fd.headers.get("ETag")
+                last_modified = fd.headers.get("Last-Modified")
+
+        except HTTPError as e:
+            if e.code == 304:
+                return None
+
+            raise e
+
+        alerts = []
         for feature in data.get("features", []):
             properties = feature.get("properties", {})
             headline = properties.get("headline")
             description = properties.get("description")
 
-            yield headline, description
+            alerts.append((headline, description))
+
+        return alerts, etag, last_modified
+
+    def _get_alerts(self, latitude: float, longitude: float) -> List[Tuple[str, str]]:
+        cell = self._grid_cell(latitude, longitude)
+        entry = self._cache.lookup(cell)
+        if entry is not None and entry[1]:
+            return entry[0][0]
 
-    @staticmethod
-    def _get_position(interface: MeshInterface, node_id: str) -> Optional[dict]:
-        keys = {"latitude", "longitude"}
-        position = interface.nodes.get(node_id, {}).get("position", None)
-        if position and all(k in position for k in keys):
-            return position
+        # everyone in the cell shares the answer for the cell center
+        center = cell[0] * self._cache_grid, cell[1] * self._cache_grid
+        if entry is None:
+            result = self._fetch_alerts(*center)
+
+        else:
+            _, etag, last_modified = entry[0]
+            result = self._fetch_alerts(*center, etag=etag, last_modified=last_modified)
+            if result is None:
+                self._revalidations += 1
+                result = entry[0]
 
-        return None
+        self._cache.put(cell, result)
+        return result[0]
 
-    def __call__(self, escape: str, packet: dict, interface: MeshInterface):
+    def reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
         from_id = packet["fromId"]
 
         replies = []
-        position = self._get_position(interface, from_id)
+        position = node_directory.position(from_id, interface)
         if position:
 
-            alerts = list(h for h, _ in self._get_alerts(position["latitude"], position["longitude"]))
+            alerts = list(h for h, _ in self._get_alerts(*position))
             alert_count = len(alerts)
             if alert_count == 1:
                 replies.append(f"{alerts[0].strip()}".strip())
@@ -64,5 +141,4 @@ class NoaaCmd(BaseCmd):
         else:
             replies.append(f"no qth data".strip())
 
-        replies[0] = self.apply_channel_prefix(packet, interface, replies[0])
-        self.send_reply(replies, packet, interface)
+        return replies
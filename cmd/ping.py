@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List
 
 from meshtastic.mesh_interface import MeshInterface
 
@@ -14,7 +15,7 @@ class PingCmd(BaseCmd):
     def help_line(self, escape: str) -> str:
         return f"{super().help_line(escape)}: reports packet received time"
 
-    def __call__(self, escape: str, packet: dict, interface: MeshInterface):
+    def reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
         now = datetime.now()
         buf = ["pong"]
 
@@ -25,5 +26,4 @@ class PingCmd(BaseCmd):
         buf.append(f'host time: {now.strftime("%H:%M:%S")}')
         buf.append(f'hops: {packet.get("hopLimit", "*")}/{packet.get("hopStart", "*")}')
 
-        text = self.apply_channel_prefix(packet, interface, "\n".join(buf))
-        self.send_reply([text], packet, interface)
+        return ["\n".join(buf)]
@@ -0,0 +1,78 @@
+import importlib
+import logging
+from importlib.metadata import entry_points
+from logging import Logger
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Type
+
+from .base import BaseCmd
+
+
+class CmdRegistry:
+    ENTRY_POINT_GROUP = "meshecho.cmds"
+
+    # config section -> (module, class), modules are only imported once their section is enabled
+    BUILTIN_CMDS = {
+        "EchoCmd": ("cmd.echo", "EchoCmd"),
+        "ManCmd": ("cmd.man", "ManCmd"),
+        "NoaaCmd": ("cmd.noaa", "NoaaCmd"),
+        "PingCmd": ("cmd.ping", "PingCmd"),
+        "RollCmd": ("cmd.roll", "RollCmd"),
+        "StatsCmd": ("cmd.stats", "StatsCmd"),
+        "TopCmd": ("cmd.top", "TopCmd"),
+    }
+
+    def __init__(self, logger: Logger = None):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._specs: Dict[str, Tuple[str, str]] = None
+        self._loaded: Dict[str, Type[BaseCmd]] = {}
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    def _get_specs(self) -> Dict[str, Tuple[str, str]]:
+        if self._specs is not None:
+            return self._specs
+
+        specs = dict(self.BUILTIN_CMDS)
+        for entry_point in entry_points(group=self.ENTRY_POINT_GROUP):
+            if entry_point.name in specs:
+                self.logger.warning(f"plugin {entry_point.value} ignored: {entry_point.name} is already registered")
+                continue
+
+            specs[entry_point.name] = (entry_point.module, entry_point.attr)
+
+        self._specs = specs
+        return specs
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._get_specs()
+
+    def names(self) -> List[str]:
+        return sorted(self._get_specs().keys())
+
+    def enabled(self, config: dict) -> List[str]:
+        return [name for name in self.names() if name in config]
+
+    def load(self, name: str) -> Type[BaseCmd]:
+        cmd = self._loaded.get(name)
+        if cmd is not None:
+            return cmd
+
+        spec = self._get_specs().get(name)
+        if spec is None:
+            raise KeyError(f"unknown cmd: {name}")
+
+        module_name, attr = spec
+        cmd = getattr(importlib.import_module(module_name), attr)
+        if not isinstance(cmd, type) or not issubclass(cmd, BaseCmd):
+            raise TypeError(f"{module_name}:{attr} is not a {BaseCmd.__name__}")
+
+        self._loaded[name] = cmd
+        return cmd
+
+
+cmd_registry = CmdRegistry()
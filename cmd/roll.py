@@ -10,6 +10,7 @@ from .base import BaseCmd
 
 
 class RollCmd(BaseCmd):
+    _ROLL_PATTERN = re.compile(r"^(\d+)?(?:d(\d+))?$")
 
     def __init__(self, config: dict):
         super().__init__(key="roll", config=config)
@@ -25,40 +26,23 @@ class RollCmd(BaseCmd):
         return f"{super().help_line(escape)}: [N][dM]- generate random (N)umbers X where X in [1,M]"
 
     def get_numbers(self, text: str) -> Tuple[Optional[int], Optional[int], List[int]]:
-        if text:
-
-            rolls, sides = None, None
-            if re.match(rf"^{self.key}$", text):
-                # no args
-                rolls, sides = self._default_rolls, self._default_sides
-
-            elif re.match(rf"^{self.key}\d+$", text):
-                # N
-                args = re.findall(r"\d+", text)
-                rolls, sides = int(args[0]), self._default_sides
-
-            elif re.match(rf"^{self.key}\d+d\d+$", text):
-                # NdM
-                args = re.findall(r"\d+", text)
-                rolls, sides = int(args[0]), int(args[1])
-
-            elif re.match(rf"^{self.key}d\d+", text):
-                # dM
-                args = re.findall(r"\d+", text)
-                rolls, sides = 3, int(args[0])
-
-            if rolls is not None and sides is not None:
-                rolls, sides = min(rolls, self._max_rolls), min(sides, self._max_sides)
+        # "", "N", "NdM" or "dM"
+        match = self._ROLL_PATTERN.match(text)
+        if match:
+            rolls, sides = match.groups()
+            rolls = int(rolls) if rolls else self._default_rolls
+            sides = int(sides) if sides else self._default_sides
+
+            rolls, sides = min(rolls, self._max_rolls), min(sides, self._max_sides)
+            if rolls > 0 and sides > 0:
                 return rolls, sides, [random.randint(1, sides) for _ in range(rolls)]
 
-            return None, None, []
+        return None, None, []
 
-    def __call__(self, escape: str, packet: dict, interface: MeshInterface):
+    def reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
 
-        text = "".join(self.get_text(packet).lstrip(escape).split())
-        count, upper_range, numbers = self.get_numbers(text)
+        count, upper_range, numbers = self.get_numbers("".join(args.split()))
         if numbers:
-            reply = f'{count}d{upper_range} Σ({",".join(str(i) for i in numbers)})={sum(numbers)}'
+            return [f'{count}d{upper_range} Σ({",".join(str(i) for i in numbers)})={sum(numbers)}']
 
-            reply = self.apply_channel_prefix(packet, interface, reply)
-            self.send_reply([reply], packet, interface)
+        return []
@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+from typing import Hashable
+from typing import List
+
+from meshtastic.mesh_interface import MeshInterface
+
+from metrics import metrics
+from .base import BaseCmd
+
+
+class StatsCmd(BaseCmd):
+    def __init__(self, config: dict):
+        super().__init__(key="stats", config=config)
+
+        self.logger.info(f"cmd enabled: {self.__class__.__name__}")
+
+    def help_line(self, escape: str) -> str:
+        return f"{super().help_line(escape)} [cmd]: reports bot statistics"
+
+    @staticmethod
+    def _value(name: str, **labels) -> float:
+        metric = metrics.find(name).get(tuple(sorted(labels.items())))
+        if metric is None:
+            return 0
+
+        return metric() if callable(metric) else metric.value
+
+    def _summary(self) -> list:
+        uptime = timedelta(seconds=time.time() - metrics.start_time)
+        invocations = sum(m.value for m in metrics.find("cmd_invocations_total").values())
+        errors = sum(m.value for m in metrics.find("cmd_errors_total").values())
+        # every received packet goes through the router once, the subscribers behind it would count it again
+        packets = self._value("subscriber_packets_total", subscriber="PacketRouter")
+
+        return [
+            f"uptime:{self.format_time_delta(uptime)}",
+            f"packets:{packets:.0f}, cmds:{invocations:.0f}, errors:{errors:.0f}",
+            f"sent:{self._value('packets_sent_total'):.0f}, airtime:{self._value('send_airtime_seconds_total'):.1f}s",
+            f"queue:{self._value('cmd_queue_depth'):.0f}, dropped:{self._value('cmd_queue_dropped_total'):.0f}",
+        ]
+
+    def _cmd_stats(self, key: str) -> list:
+        latency = metrics.find("cmd_latency_seconds").get((("cmd", key),))
+        if latency is None:
+            return [f"unknown cmd: {key}"]
+
+        mean = latency.sum / latency.count if latency.count else 0.0
+        return [
+            f"{key}: {self._value('cmd_invocations_total', cmd=key):.0f} calls, "
+            f"{self._value('cmd_errors_total', cmd=key):.0f} errors",
+            f"latency avg:{mean * 1e3:.1f}ms, p95:<{latency.quantile(0.95) * 1e3:.1f}ms",
+        ]
+
+    def cache_key(self, escape: str, packet: dict, args: str) -> Hashable:
+        words = args.split()
+        return words[0].removeprefix(escape) if words else None
+
+    def reply(self, escape: str, packet: dict, interface: MeshInterface, args: str) -> List[str]:
+        words = args.split()
+        if words:
+            buf = self._cmd_stats(words[0].removeprefix(escape))
+        else:
+            buf = self._summary()
+
+        return ["\n".join(buf)]
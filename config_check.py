@@ -2,11 +2,23 @@ import logging
 from logging import Logger
 
 
+class ConfigError(Exception):
+    pass
+
+
 class ConfigCheck:
 
-    def __init__(self, root_config: dict, config_name: str, required: list = None, logger: Logger = None):
+    def __init__(
+            self,
+            root_config: dict,
+            config_name: str,
+            required: list = None,
+            logger: Logger = None,
+            optional: bool = False
+    ):
         self._config_name = config_name
         self._required = required.copy() if required else []
+        self._optional = optional
 
         self._logger = logger or logging.getLogger(self.__class__.__name__)
 
@@ -26,14 +38,15 @@ class ConfigCheck:
 
     def validate_config(self, config: dict):
         sub_config = config.get(self.config_name, None)
-        if sub_config is None:
-            self.logger.error(f"{self.config_name} is not defined in config file")
-            exit(1)
+        if sub_config is None and self._optional:
+            return {}
+
+        elif sub_config is None:
+            self.fail(f"{self.config_name} is not defined in config file")
         else:
             for k in self.required:
                 if k not in sub_config:
-                    self.logger.error(f"{self.config_name}[{k}] is not defined in config file")
-                    exit(1)
+                    self.fail(f"{self.config_name}[{k}] is not defined in config file")
 
         return self.get_sub_config(config)
 
@@ -43,10 +56,14 @@ class ConfigCheck:
     def get(self, key: str, default=None, type_=None):
         value = self._config.get(key, default)
         if value is not default and type_ is not None and not isinstance(value, type_):
-            self.logger.error(f"{self.config_name}[{key}] is not type {type_}")
-            exit(1)
+            self.fail(f"{self.config_name}[{key}] is not type {type_}")
 
         return value
 
+    def fail(self, message: str):
+        # logged where it was found, the caller decides whether to exit or keep the running config
+        self.logger.error(message)
+        raise ConfigError(message)
+
     def __getitem__(self, item):
         return self._config[item]
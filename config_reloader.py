@@ -0,0 +1,145 @@
+import logging
+import os
+import signal
+import threading
+import tomllib
+from logging import Logger
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+
+from config_check import ConfigCheck
+from config_check import ConfigError
+from metrics import metrics
+
+
+class ConfigReloader:
+    # owned by the connections and threads that live for the whole process
+    RESTART_SECTIONS = (
+        "meshtastic",
+        "mqtt",
+        "Supervisor",
+        "SendScheduler",
+        "Metrics",
+        "HostSampler",
+        "PacketRouter",
+        "JournalSubscriber",
+        "RecorderSubscriber",
+        "ConfigReloader",
+    )
+
+    def __init__(self, path: str, config: dict, apply: Callable[[dict], None], logger: Logger = None):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+
+        config_check = ConfigCheck(config, self.__class__.__name__, None, self.logger, optional=True)
+        self._watch = config_check.get("watch", True, bool)
+        self._interval = config_check.get("interval", 5, (int, float))
+        if self._interval <= 0:
+            config_check.fail(f"config error: 'interval' must be positive")
+
+        self._path = path
+        self._config = config
+        self._apply = apply
+        self._stat = self._file_stat()
+
+        self._reload_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self._metric_reloads = metrics.counter("config_reloads_total", "config reloads applied")
+        self._metric_errors = metrics.counter("config_reload_errors_total", "config reloads rejected")
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    @property
+    def config(self) -> dict:
+        return self._config
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._path)
+
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    def install_signal_handler(self):
+        # only the main thread can install it, the reload itself runs in the reloader thread
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request())
+
+    def request(self):
+        self._reload_event.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+        watching = f", watching every {self._interval}s" if self._watch else ""
+        self.logger.info(f"reloading {self._path} on SIGHUP{watching}")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        self._reload_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            requested = self._reload_event.wait(self._interval if self._watch else None)
+            if self._stop_event.is_set():
+                return
+
+            self._reload_event.clear()
+            stat = self._file_stat()
+            if not requested and stat == self._stat:
+                continue
+
+            self._stat = stat
+            try:
+                self.reload()
+
+            except Exception:
+                self._metric_errors.inc()
+                self.logger.exception("failed to reload config")
+
+    def reload(self) -> bool:
+        try:
+            with open(self._path, "rb") as fd:
+                config = tomllib.load(fd)
+
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            self._metric_errors.inc()
+            self.logger.error(f"reload failed, keeping the running config: {e}")
+            return False
+
+        changed = sorted(
+            name for name in set(config) | set(self._config) if config.get(name) != self._config.get(name)
+        )
+        if not changed:
+            self.logger.info(f"{self._path} unchanged")
+            return True
+
+        restart = [name for name in changed if name in self.RESTART_SECTIONS]
+        if restart:
+            self.logger.warning(f"changes to {', '.join(f'[{name}]' for name in restart)} need a restart")
+
+        if len(restart) < len(changed):
+            try:
+                self._apply(config)
+
+            except ConfigError:
+                # already logged where it was found
+                self._metric_errors.inc()
+                self.logger.error("reload failed, keeping the running config")
+                return False
+
+            self._metric_reloads.inc()
+            reloaded = ", ".join(f"[{name}]" for name in changed if name not in self.RESTART_SECTIONS)
+            self.logger.info(f"reloaded {reloaded}")
+
+        self._config = config
+        return True
@@ -0,0 +1,257 @@
+import re
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+_FIELD_PATTERN = re.compile(r"value_json\.(\w+)")
+
+
+def device_metrics_discovery(node_id: str):
+    if node_id.startswith("!"):
+        node_id = node_id.lstrip("!")
+
+    state_topic = f"homeassistant/sensor/{node_id}_device_metrics/state"
+    payloads = [
+        {
+            "expire_after": 2400,
+            "min": 0,
+            "max": 101,
+            "device_class": "battery",
+            "state_topic": state_topic,
+            "unit_of_measurement": "%",
+            "value_template": "{{ value_json.batteryLevel | round(0) }}",
+            "name": f"{node_id}_batteryLevel",
+            "object_id": f"{node_id}_batteryLevel",
+            "unique_id": f"{node_id}_batteryLevel",
+            "device": {
+                "identifiers": [f"{node_id}"],
+                "name": f"{node_id}",
+            }
+        },
+        {
+            "expire_after": 2400,
+            "min": 0,
+            "max": 4.40,
+            "device_class": "voltage",
+            "state_topic": state_topic,
+            "unit_of_measurement": "V",
+            "value_template": "{{ value_json.voltage | round(2) }}",
+            "name": f"{node_id}_voltage",
+            "object_id": f"{node_id}_voltage",
+            "unique_id": f"{node_id}_voltage",
+            "device": {
+                "identifiers": [f"{node_id}"],
+                "name": f"{node_id}",
+            }
+        },
+        {
+            "expire_after": 2400,
+            "icon": "mdi:radio-tower",
+            "state_topic": state_topic,
+            "unit_of_measurement": "%",
+            "value_template": "{{ value_json.airUtilTx | round(2) }}",
+            "name": f"{node_id}_airUtilTx",
+            "object_id": f"{node_id}_airUtilTx",
+            "unique_id": f"{node_id}_airUtilTx",
+            "device": {
+                "identifiers": [f"{node_id}"],
+                "name": f"{node_id}",
+            }
+        },
+        {
+            "expire_after": 2400,
+            "icon": "mdi:radio-tower",
+            "state_topic": state_topic,
+            "unit_of_measurement": "%",
+            "value_template": "{{ value_json.channelUtilization | round(2) }}",
+            "name": f"{node_id}_channelUtilization",
+            "object_id": f"{node_id}_channelUtilization",
+            "unique_id": f"{node_id}_channelUtilization",
+            "device": {
+                "identifiers": [f"{node_id}"],
+                "name": f"{node_id}",
+            }
+        },
+    ]
+
+    for payload in payloads:
+        topic_path = [
+            "homeassistant",
+            "sensor",
+            payload["unique_id"],
+            "config"
+        ]
+        discovery_topic = "/".join(topic_path)
+        yield discovery_topic, payload
+
+
+def environment_metrics_discovery(node_id: str):
+    if node_id.startswith("!"):
+        node_id = node_id.lstrip("!")
+
+    state_topic = f"homeassistant/sensor/{node_id}_environment_metrics/state"
+    payloads = [
+        {
+            "expire_after": 2400,
+            "device_class": "temperature",
+            "state_topic": state_topic,
+            "unit_of_measurement": "°C",
+            "value_template": "{{ value_json.temperature | round(1) }}",
+            "name": f"{node_id}_temperature",
+            "object_id": f"{node_id}_temperature",
+            "unique_id": f"{node_id}_temperature",
+            "device": {
+                "identifiers": [f"{node_id}"],
+                "name": f"{node_id}",
+            }
+        },
+        {
+            "expire_after": 2400,
+            "device_class": "humidity",
+            "state_topic": state_topic,
+            "unit_of_measurement": "%",
+            "value_template": "{{ value_json.relativeHumidity | round(0) }}",
+            "name": f"{node_id}_relativeHumidity",
+            "object_id": f"{node_id}_relativeHumidity",
+            "unique_id": f"{node_id}_relativeHumidity",
+            "device": {
+                "identifiers": [f"{node_id}"],
+                "name": f"{node_id}",
+            }
+        },
+        {
+            "expire_after": 2400,
+            "device_class": "humidity",
+            "state_topic": state_topic,
+            "unit_of_measurement": "hPa",
+            "value_template": "{{ value_json.barometricPressure | round(1) }}",
+            "name": f"{node_id}_barometricPressure",
+            "object_id": f"{node_id}_barometricPressure",
+            "unique_id": f"{node_id}_barometricPressure",
+            "device": {
+                "identifiers": [f"{node_id}"],
+                "name": f"{node_id}",
+            }
+        },
+    ]
+
+    for payload in payloads:
+        topic_path = [
+            "homeassistant",
+            "sensor",
+            payload["unique_id"],
+            "config"
+        ]
+        discovery_topic = "/".join(topic_path)
+        yield discovery_topic, payload
+
+
+def position_discovery(node_id: str):
+    if node_id.startswith("!"):
+        node_id = node_id.lstrip("!")
+
+    topic = f"homeassistant/device_tracker/{node_id}_position/config"
+    payload = {
+        "json_attributes_topic": f"homeassistant/device_tracker/{node_id}_position/attributes",
+        "name": f"{node_id}_position",
+        "object_id": f"{node_id}_position",
+        "unique_id": f"{node_id}_position",
+        "device": {
+            "identifiers": [f"{node_id}"],
+            "name": f"{node_id}",
+        }
+    }
+    yield topic, payload
+
+
+def local_stats_discovery(node_id: str):
+    _ = {
+        "numPacketsTx",
+        "numTotalNodes",
+        "uptimeSeconds"
+    }
+
+    if node_id.startswith("!"):
+        node_id = node_id.lstrip("!")
+
+    state_topic = f"homeassistant/sensor/{node_id}_local_stats/state"
+
+    payloads = []
+
+    names = [
+        "numOnlineNodes",
+        "numTotalNodes",
+    ]
+    for name in names:
+        payloads.append(
+            {
+                "expire_after": 1200,
+                "state_topic": state_topic,
+                "unit_of_measurement": "node",
+                "value_template": f"{{{{ value_json.{name} }}}}",
+                "name": f"{node_id}_{name}",
+                "object_id": f"{node_id}_{name}",
+                "unique_id": f"{node_id}_{name}",
+                "device": {
+                    "identifiers": [f"{node_id}"],
+                    "name": f"{node_id}",
+                }
+            }
+        )
+    names = [
+        "numPacketsRx",
+        "numPacketsRxBad",
+        "numPacketsTx",
+    ]
+    for name in names:
+        payloads.append(
+            {
+                "expire_after": 1200,
+                "state_topic": state_topic,
+                "unit_of_measurement": "packet",
+                "value_template": f"{{{{ value_json.{name} }}}}",
+                "name": f"{node_id}_{name}",
+                "object_id": f"{node_id}_{name}",
+                "unique_id": f"{node_id}_{name}",
+                "device": {
+                    "identifiers": [f"{node_id}"],
+                    "name": f"{node_id}",
+                }
+            }
+        )
+
+    for payload in payloads:
+        topic_path = [
+            "homeassistant",
+            "sensor",
+            payload["unique_id"],
+            "config"
+        ]
+        discovery_topic = "/".join(topic_path)
+        yield discovery_topic, payload
+
+
+# metric group -> discovery topics of a node
+DISCOVERIES: Dict[str, Callable[[str], Iterator[Tuple[str, dict]]]] = {
+    "device_metrics": device_metrics_discovery,
+    "environment_metrics": environment_metrics_discovery,
+    "local_stats": local_stats_discovery,
+    "position": position_discovery,
+}
+
+
+def payload_field(payload: dict) -> Optional[str]:
+    # telemetry field a sensor reads, None for payloads that are not tied to one field
+    match = _FIELD_PATTERN.search(payload.get("value_template", ""))
+    return match.group(1) if match else None
+
+
+def aggregate_payload(payload: dict, field: str, stat: str) -> Tuple[str, dict]:
+    # sensor of an aggregate published next to the field, e.g. voltage_mean
+    unique_id = f"{payload['unique_id']}_{stat}"
+    payload = dict(payload)
+    payload["value_template"] = payload["value_template"].replace(f"value_json.{field}", f"value_json.{field}_{stat}")
+    payload["name"] = payload["object_id"] = payload["unique_id"] = unique_id
+    return f"homeassistant/sensor/{unique_id}/config", payload
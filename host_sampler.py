@@ -0,0 +1,168 @@
+import glob
+import logging
+import subprocess
+import threading
+import time
+from logging import Logger
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import psutil
+
+from config_check import ConfigCheck
+from metrics import metrics
+
+
+class HostSnapshot(NamedTuple):
+    time: float
+    load: Tuple[float, float, float]
+    memory_percent: float
+    swap_percent: float
+    boot_time: float
+    temperature: Optional[float]
+    throttled: Optional[int]
+
+    @property
+    def uptime(self) -> float:
+        return time.time() - self.boot_time
+
+
+class HostSampler:
+    # exposed by the raspberry pi firmware driver, same value as `vcgencmd get_throttled`
+    THROTTLED_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+    THERMAL_GLOB = "/sys/class/thermal/thermal_zone*/temp"
+
+    # https://www.raspberrypi.com/documentation/computers/os.html#get_throttled
+    THROTTLED_FLAGS = (
+        (0, "Undervoltage detected"),
+        (1, "Arm frequency capped"),
+        (2, "Currently throttled"),
+        (3, "Soft temperature limit active"),
+        (16, "Undervoltage has occurred"),
+        (17, "Arm frequency capping has occurred"),
+        (18, "Throttling has occurred"),
+        (19, "Soft temperature limit has occurred"),
+    )
+
+    def __init__(self, interval: float = 30, logger: Logger = None):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._snapshot: Optional[HostSnapshot] = None
+        self._thermal_paths = None
+        # None until probed, then False when the host has no way of reporting throttling
+        self._vcgencmd = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    @property
+    def snapshot(self) -> Optional[HostSnapshot]:
+        return self._snapshot
+
+    def configure(self, config: dict):
+        config_check = ConfigCheck(config, self.__class__.__name__, None, self.logger, optional=True)
+        self._interval = config_check.get("interval", self._interval, (int, float))
+        if self._interval <= 0:
+            config_check.fail(f"config error: 'interval' must be positive")
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            # the first sample is taken right away so readers always have a snapshot
+            self.sample()
+            self._register_metrics()
+            self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+            self._thread.start()
+
+        self.logger.info(f"sampling host status every {self._interval}s")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _register_metrics(self):
+        metrics.gauge("host_load1", "1 minute load average", lambda: self._snapshot.load[0])
+        metrics.gauge("host_memory_percent", "memory in use", lambda: self._snapshot.memory_percent)
+        metrics.gauge("host_swap_percent", "swap in use", lambda: self._snapshot.swap_percent)
+        metrics.gauge("host_uptime_seconds", "host uptime", lambda: round(self._snapshot.uptime))
+        if self._snapshot.temperature is not None:
+            metrics.gauge("host_temperature_celsius", "hottest thermal zone", lambda: self._snapshot.temperature)
+        if self._snapshot.throttled is not None:
+            metrics.gauge("host_throttled", "raspberry pi throttled flags", lambda: self._snapshot.throttled)
+
+    def _read_temperature(self) -> Optional[float]:
+        if self._thermal_paths is None:
+            self._thermal_paths = sorted(glob.glob(self.THERMAL_GLOB))
+
+        temperatures = []
+        for path in self._thermal_paths:
+            try:
+                with open(path, "r") as fd:
+                    temperatures.append(int(fd.read()) / 1000)
+
+            except (OSError, ValueError):
+                continue
+
+        return max(temperatures) if temperatures else None
+
+    def _read_throttled(self) -> Optional[int]:
+        try:
+            with open(self.THROTTLED_PATH, "r") as fd:
+                return int(fd.read().strip(), 16)
+
+        except (OSError, ValueError):
+            pass
+
+        # older kernels only report it through the firmware tool
+        if self._vcgencmd is False:
+            return None
+
+        try:
+            result = subprocess.run(["vcgencmd", "get_throttled"], stdout=subprocess.PIPE, timeout=5)
+            self._vcgencmd = True
+            return int(result.stdout.decode().strip().split("=")[-1], 0)
+
+        except FileNotFoundError:
+            self._vcgencmd = False
+
+        except (subprocess.SubprocessError, ValueError) as e:
+            self.logger.debug(f"vcgencmd failed: {e!r}")
+
+        return None
+
+    def sample(self) -> HostSnapshot:
+        snapshot = HostSnapshot(
+            time=time.time(),
+            load=psutil.getloadavg(),
+            memory_percent=psutil.virtual_memory().percent,
+            swap_percent=psutil.swap_memory().percent,
+            boot_time=psutil.boot_time(),
+            temperature=self._read_temperature(),
+            throttled=self._read_throttled(),
+        )
+        self._snapshot = snapshot
+        return snapshot
+
+    @classmethod
+    def throttled_status(cls, throttled: int) -> List[str]:
+        return [status for bit, status in cls.THROTTLED_FLAGS if (1 << bit) & throttled]
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.sample()
+
+            except Exception:
+                self.logger.exception("failed to sample host status")
+
+
+host_sampler = HostSampler()
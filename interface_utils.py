@@ -1,9 +1,11 @@
 from meshtastic.mesh_interface import MeshInterface
 
+from node_directory import node_directory
+
 
 def get_long_name(interface: MeshInterface, from_id: str):
-    return interface.nodes.get(from_id, {}).get("user", {}).get("longName", from_id)
+    return node_directory.long_name(from_id, interface)
 
 
 def get_short_name(interface: MeshInterface, from_id: str):
-    return interface.nodes.get(from_id, {}).get("user", {}).get("shortName", from_id)
+    return node_directory.short_name(from_id, interface)
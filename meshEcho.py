@@ -1,26 +1,70 @@
 #!/usr/bin/env python
 
+import functools
 import logging
 import os.path
 import re
+import threading
 import time
 import tomllib
 from argparse import ArgumentParser
 from argparse import ArgumentTypeError
+from argparse import Namespace
+from concurrent.futures import Future
 from logging import Logger
-from sys import exit
+from typing import Callable
+from typing import Dict
+from typing import List
 from typing import Optional
+from typing import Tuple
 
 import paho.mqtt.client as mqtt
-from meshtastic.ble_interface import BLEInterface
-from meshtastic.serial_interface import SerialInterface
+from meshtastic.mesh_interface import MeshInterface
 
 from config_check import ConfigCheck
+from config_check import ConfigError
+from config_reloader import ConfigReloader
+from metrics import MetricsExporter
+from node_directory import node_directory
+from send_scheduler import SendScheduler
 from subscriber import CmdSubscriber
 from subscriber import MqttSubscriber
+from subscriber import PacketRouter
+from subscriber.base import BaseSubscriber
+from supervisor import MqttSupervisor
+from supervisor import RadioSupervisor
 
 
-def load_config() -> dict:
+class StartupProfiler:
+
+    def __init__(self, logger: Logger, enabled: bool):
+        self._logger = logger
+        self._enabled = enabled
+        self._start = time.perf_counter()
+        if enabled:
+            # psutil is only loaded when profiling, the process start time is carried over to perf_counter
+            import psutil
+            self._start -= time.time() - psutil.Process().create_time()
+        self._last = self._start
+        self._phases = []
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self._phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        for phase, elapsed in self._phases:
+            self._logger.info(f"startup {phase:<20} {elapsed * 1e3:8.1f}ms")
+
+        self._logger.info(f"startup {'total':<20} {(self._last - self._start) * 1e3:8.1f}ms")
+
+
+def read_args() -> Namespace:
     def is_file(s):
         if not os.path.isfile(s):
             raise ArgumentTypeError(f"{s} is not a file")
@@ -34,14 +78,22 @@ def load_config() -> dict:
         required=False,
         type=is_file
     )
-    args = parser.parse_args()
-    with open(args.config, "rb") as fd:
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="prints how long each startup phase took once connected, then exits"
+    )
+    return parser.parse_args()
+
+
+def load_config(path: str) -> dict:
+    with open(path, "rb") as fd:
         config = tomllib.load(fd)
 
     return config
 
 
-def get_mqtt_client(config: dict, logger: Logger) -> Optional[mqtt.Client]:
+def get_mqtt_client(config: dict, logger: Logger) -> Tuple[Optional[mqtt.Client], Optional[MqttSupervisor]]:
     mqtt_config = ConfigCheck(
         config,
         "mqtt",
@@ -59,76 +111,149 @@ def get_mqtt_client(config: dict, logger: Logger) -> Optional[mqtt.Client]:
             username=mqtt_config["username"],
             password=mqtt_config["password"]
         )
-        try:
-            mqtt_client.connect(
-                host=mqtt_config["host"],
-                port=mqtt_config.get("port", 1883, int),
-                keepalive=mqtt_config.get("keepalive", 60, int)
-            )
-            mqtt_client.loop_start()
-        except ConnectionRefusedError:
-            logger.error(f"failed to setup mqtt client: Connection refused")
-            exit(1)
-
-        for index in range(3):
-            time.sleep(1)
-            if mqtt_client.is_connected():
-                break
-            else:
-                logger.info("trying to connect to mqtt broker...")
-
-        if not mqtt_client.is_connected():
-            logger.error("failed to connect to mqtt broker")
-            exit(1)
-
-        return mqtt_client
+        mqtt_supervisor = MqttSupervisor(config, mqtt_client)
+
+        # the connection is made by the network thread while the radio connects
+        mqtt_client.connect_async(
+            host=mqtt_config["host"],
+            port=mqtt_config.get("port", 1883, int),
+            keepalive=mqtt_config.get("keepalive", 60, int)
+        )
+        mqtt_client.loop_start()
+
+        return mqtt_client, mqtt_supervisor
 
     else:
         logger.info("mqtt client disabled")
-        return None
+        return None, None
+
+
+def wait_for_mqtt(config: dict, mqtt_supervisor: MqttSupervisor, logger: Logger):
+    mqtt_config = ConfigCheck(config, "mqtt", None, logger)
+    timeout = mqtt_config.get("connect_timeout", 10, (int, float))
+
+    if not mqtt_supervisor.connected.wait(timeout):
+        logger.warning("mqtt broker not connected yet, retrying in the background")
+        return
+
+    logger.info("connected to mqtt broker")
 
 
 def get_interface(port: str, logger: Logger):
+    # backends are imported on demand, the BLE stack alone is slower to import than the rest of meshEcho
     if os.path.isfile(port):
         logger.info("port looks like a path, trying SerialInterface")
+        from meshtastic.serial_interface import SerialInterface
         return SerialInterface(devPath=port)
 
     if re.match(r"^([0-9A-F]{2}:){5}([0-9A-F]{2})$", port):
         logger.info("port looks like a MAC address, trying BLEInterface")
+        from meshtastic.ble_interface import BLEInterface
         return BLEInterface(address=port)
 
+    match = re.match(r"^tcp://([^:/]+)(?::(\d+))?$", port)
+    if match:
+        logger.info("port looks like a tcp address, trying TCPInterface")
+        from meshtastic.tcp_interface import TCPInterface
+        host, tcp_port = match.groups()
+        return TCPInterface(hostname=host, portNumber=int(tcp_port or 4403))
+
     logger.error(f"unsupported interface: {port}")
     raise NotImplementedError(f"unsupported interface: {port}")
 
 
-def connect_to_node(config: dict, logger: Logger):
-    mesh_config = ConfigCheck(config, "meshtastic", ["port"], logger)
-    port = mesh_config["port"]
+def get_radios(config: dict, logger: Logger) -> Dict[str, Tuple[str, Optional[str]]]:
+    # name -> (port, modem preset), a lone `port` is the radio named "radio"
+    meshtastic_config = ConfigCheck(config, "meshtastic", None, logger)
+    radios = meshtastic_config.get("radios", {}, dict)
+    if not radios:
+        return {"radio": (ConfigCheck(config, "meshtastic", ["port"], logger)["port"], None)}
+
+    if meshtastic_config.get("port") is not None:
+        meshtastic_config.fail("config error: [meshtastic] 'port' and 'radios' are mutually exclusive")
+
+    ports = {}
+    for name in radios:
+        radio_config = ConfigCheck(radios, name, ["port"], logger)
+        modem_preset = radio_config.get("modem_preset", None, str)
+        if modem_preset is not None and modem_preset.upper() not in SendScheduler.MODEM_PRESETS:
+            radio_config.fail(f"config error: unsupported 'modem_preset' {modem_preset} for radio {name}")
+
+        ports[name] = (radio_config.get("port", None, str), modem_preset)
+
+    return ports
 
-    exit_flag = False
-    while not exit_flag:
-        logger.info(f"trying to connect to {port}...")
+
+def connect_radio(port: str, modem_preset: Optional[str], scheduler: SendScheduler, logger: Logger) -> MeshInterface:
+    interface = get_interface(port, logger)
+    if modem_preset is not None:
+        scheduler.set_modem_preset(interface, modem_preset)
+
+    return interface
+
+
+def start_interface(port: str, connect: Callable[[], MeshInterface], logger: Logger) -> Future:
+    logger.info(f"trying to connect to {port}...")
+    future = Future()
+
+    def connect_():
         try:
-            iface = get_interface(port, logger)
-            logger.info(f"connected to {port}")
+            future.set_result(connect())
+
+        except BaseException as e:
+            future.set_exception(e)
 
-            logger.info(f"{iface.getShortName()} {iface.getLongName()}")
+    threading.Thread(target=connect_, name="connect", daemon=True).start()
+    return future
 
-            while iface.isConnected.is_set():
-                try:
-                    time.sleep(5)
 
-                except KeyboardInterrupt:
-                    exit_flag = True
-                    iface.close()
-                    break
+def build_subscribers(config: dict, mqtt_client: mqtt.Client, scheduler: SendScheduler) -> List[BaseSubscriber]:
+    # the subscribers rebuilt on reload, the connections they use are kept
+    mqtt_sub = MqttSubscriber(config, mqtt_client)
+    try:
+        cmd_sub = CmdSubscriber(config, scheduler)
 
-            if not exit_flag:
-                logger.info("trying to reconnect...")
-                time.sleep(5)
-        except FileNotFoundError:
-            logger.info(f"port not found {port}...")
-            exit_flag = True
+    except ConfigError:
+        mqtt_sub.close()
+        raise
+
+    return [mqtt_sub, cmd_sub]
+
+
+def reload_subscribers(config: dict, mqtt_client: mqtt.Client, scheduler: SendScheduler, router: PacketRouter):
+    reloaded = build_subscribers(config, mqtt_client, scheduler)
+    kept = [s for s in router.subscribers if not isinstance(s, (MqttSubscriber, CmdSubscriber))]
+
+    for subscriber in router.swap(reloaded + kept):
+        if subscriber not in kept:
+            subscriber.close()
+
+    # the replaced subscribers' gauges are gone, a removed cmd is no longer exported
+    for subscriber in reloaded:
+        subscriber.register_metrics()
+
+
+def connect_to_nodes(supervisors: List[RadioSupervisor], pending: List[Future]):
+    # every radio is reconnected by its own thread, replies leave through the radio the request came from
+    threads = []
+    for supervisor, future in zip(supervisors, pending):
+        thread = threading.Thread(
+            target=supervisor.run,
+            args=(future,),
+            name=f"{supervisor.__class__.__name__}-{supervisor.name}",
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+
+    try:
+        for thread in threads:
+            thread.join()
+
+    except KeyboardInterrupt:
+        for supervisor in supervisors:
+            supervisor.stop()
+            supervisor.close()
 
 
 def print_banner(logger: Logger):
@@ -151,22 +276,96 @@ def get_logger() -> Logger:
 
 def main():
     logger = get_logger()
-    config = load_config()
+    args = read_args()
+    profiler = StartupProfiler(logger, args.profile_startup)
+    profiler.mark("imports")
+
+    config = load_config(args.config)
+    profiler.mark("config")
 
     print_banner(logger)
 
-    mqtt_client = get_mqtt_client(config, logger)
+    node_directory.pubsub_subscribe()
 
-    mqtt_sub = MqttSubscriber(config, mqtt_client)
-    mqtt_sub.pubsub_subscribe()
+    mqtt_client, mqtt_supervisor = get_mqtt_client(config, logger)
+
+    scheduler = SendScheduler(config)
+    scheduler.start()
+
+    # TopCmd starts the sampler with the defaults when it is not configured
+    if "HostSampler" in config:
+        from host_sampler import host_sampler
+        host_sampler.configure(config)
+        host_sampler.start()
+
+    subscribers = build_subscribers(config, mqtt_client, scheduler)
 
-    cmd_sub = CmdSubscriber(config)
-    cmd_sub.pubsub_subscribe()
+    # optional subscribers are imported only when enabled
+    if "JournalSubscriber" in config:
+        from subscriber import JournalSubscriber
+        subscribers.append(JournalSubscriber(config))
 
-    connect_to_node(config, logger)
+    else:
+        logger.info("subscriber disabled: JournalSubscriber")
+
+    # duplicates are delivered once to the subscribers behind it
+    router = PacketRouter(config, subscribers)
+    router.pubsub_subscribe()
+    for subscriber in subscribers:
+        subscriber.register_metrics()
+
+    # the recorder sees every packet as it arrived, duplicates included
+    if "RecorderSubscriber" in config:
+        from subscriber import RecorderSubscriber
+        recorder_sub = RecorderSubscriber(config)
+        recorder_sub.pubsub_subscribe()
+
+    else:
+        logger.info("subscriber disabled: RecorderSubscriber")
+
+    metrics_exporter = MetricsExporter(config, mqtt_client)
+    metrics_exporter.start()
+    profiler.mark("subscribers")
+
+    # the radio and the broker stay connected while the subscribers are rebuilt from the new config
+    config_reloader = ConfigReloader(
+        args.config,
+        config,
+        lambda new_config: reload_subscribers(new_config, mqtt_client, scheduler, router)
+    )
+    config_reloader.install_signal_handler()
+    config_reloader.start()
+
+    supervisors, pending = [], []
+    for name, (port, modem_preset) in get_radios(config, logger).items():
+        connect = functools.partial(connect_radio, port, modem_preset, scheduler, logger)
+        radio_supervisor = RadioSupervisor(config, connect, name=name)
+        radio_supervisor.pubsub_subscribe()
+        supervisors.append(radio_supervisor)
+        pending.append(start_interface(port, connect, logger))
+
+    if mqtt_supervisor is not None:
+        wait_for_mqtt(config, mqtt_supervisor, logger)
+        profiler.mark("mqtt")
+
+    if profiler.enabled:
+        interfaces = [future.result() for future in pending]
+        profiler.mark("radio")
+        profiler.report()
+        for interface in interfaces:
+            interface.close()
+
+        return
+
+    connect_to_nodes(supervisors, pending)
 
     logger.info("exiting")
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+
+    except ConfigError:
+        # already logged where it was found
+        exit(1)
@@ -0,0 +1,302 @@
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from logging import Logger
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from config_check import ConfigCheck
+
+
+class Counter:
+    __slots__ = ("_lock", "_value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Histogram:
+    __slots__ = ("_lock", "_buckets", "_counts", "_sum", "_count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        with self._lock:
+            counts = list(self._counts)
+
+        total, result = 0, []
+        for bound, count in zip(self._buckets + (math.inf,), counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-quantile
+        cumulative = self.cumulative()
+        if not cumulative or not cumulative[-1][1]:
+            return 0.0
+
+        rank = q * cumulative[-1][1]
+        for bound, total in cumulative:
+            if total >= rank:
+                return bound if bound != math.inf else self._buckets[-1]
+
+        return self._buckets[-1]
+
+
+class MetricsRegistry:
+    LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+    def __init__(self, prefix: str = "meshecho"):
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        # name -> (type, help, {labels: metric})
+        self._families: Dict[str, Tuple[str, str, dict]] = {}
+
+    @property
+    def start_time(self) -> float:
+        return self._start_time
+
+    def _get(self, type_: str, name: str, help_: str, labels: dict, factory: Callable):
+        name = f"{self._prefix}_{name}"
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and key in family[2]:
+            return family[2][key]
+
+        with self._lock:
+            family = self._families.setdefault(name, (type_, help_, {}))
+            return family[2].setdefault(key, factory())
+
+    def counter(self, name: str, help_: str, **labels) -> Counter:
+        return self._get("counter", name, help_, labels, Counter)
+
+    def histogram(self, name: str, help_: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, help_, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name: str, help_: str, fn: Callable[[], float], **labels):
+        # gauges are sampled when collected, registering again replaces the callback
+        name = f"{self._prefix}_{name}"
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._families.setdefault(name, ("gauge", help_, {}))[2][key] = fn
+
+    def remove_gauge(self, name: str, **labels):
+        name = f"{self._prefix}_{name}"
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                return
+
+            family[2].pop(key, None)
+            if not family[2]:
+                del self._families[name]
+
+    def find(self, name: str) -> Dict[tuple, object]:
+        family = self._families.get(f"{self._prefix}_{name}")
+        return dict(family[2]) if family is not None else {}
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @classmethod
+    def _format_labels(cls, labels: tuple, extra: tuple = ()) -> str:
+        items = labels + extra
+        if not items:
+            return ""
+
+        return "{" + ",".join(f'{k}="{cls._escape(v)}"' for k, v in items) + "}"
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        if value == math.inf:
+            return "+Inf"
+
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def _families_snapshot(self):
+        with self._lock:
+            return [(name, type_, help_, dict(metrics)) for name, (type_, help_, metrics) in self._families.items()]
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for name, type_, help_, metrics in sorted(self._families_snapshot(), key=lambda f: f[0]):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {type_}")
+            for labels, metric in sorted(metrics.items()):
+                if type_ == "counter":
+                    lines.append(f"{name}{self._format_labels(labels)} {self._format_value(metric.value)}")
+
+                elif type_ == "histogram":
+                    for bound, total in metric.cumulative():
+                        bucket_labels = self._format_labels(labels, (("le", self._format_value(bound)),))
+                        lines.append(f"{name}_bucket{bucket_labels} {total}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {self._format_value(metric.sum)}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {metric.count}")
+
+                else:
+                    try:
+                        value = metric()
+
+                    except Exception:
+                        continue
+
+                    lines.append(f"{name}{self._format_labels(labels)} {self._format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, float]:
+        # flat view, histograms are reduced to their count, sum and p95
+        result = {}
+        for name, type_, _, metrics in self._families_snapshot():
+            short_name = name[len(self._prefix) + 1:]
+            for labels, metric in metrics.items():
+                suffix = "".join(f"_{v}" for _, v in labels)
+                key = f"{short_name}{suffix}"
+                if type_ == "counter":
+                    result[key] = metric.value
+
+                elif type_ == "histogram":
+                    result[f"{key}_count"] = metric.count
+                    result[f"{key}_sum"] = round(metric.sum, 6)
+                    result[f"{key}_p95"] = metric.quantile(0.95)
+
+                else:
+                    try:
+                        result[key] = metric()
+
+                    except Exception:
+                        continue
+
+        return result
+
+
+class MetricsExporter:
+
+    def __init__(self, config: dict, mqtt_client=None, registry: MetricsRegistry = None, logger: Logger = None):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._registry = registry or metrics
+
+        config_check = ConfigCheck(config, "Metrics", None, self.logger, optional=True)
+        self._textfile = config_check.get("textfile", None, str)
+        self._interval = config_check.get("interval", 60, (int, float))
+        self._mqtt_client = mqtt_client if config_check.get("mqtt", False, bool) else None
+        self._mqtt_name = config_check.get("mqtt_name", "meshecho", str)
+
+        self._announced = set()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._textfile or self._mqtt_client)
+
+    def start(self):
+        if not self.enabled:
+            self.logger.info("metrics export disabled")
+            return
+
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+        self.logger.info(f"exporting metrics every {self._interval}s")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def export(self):
+        if self._textfile:
+            self.write_textfile(self._textfile)
+
+        if self._mqtt_client is not None and self._mqtt_client.is_connected():
+            self.publish_mqtt()
+
+    def write_textfile(self, path: str):
+        # node_exporter may read at any time, write next to the file and rename
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fd:
+            fd.write(self._registry.render_prometheus())
+
+        os.replace(tmp_path, path)
+
+    def publish_mqtt(self):
+        snapshot = self._registry.snapshot()
+        state_topic = f"homeassistant/sensor/{self._mqtt_name}_metrics/state"
+
+        for key in sorted(snapshot.keys() - self._announced):
+            unique_id = f"{self._mqtt_name}_{key}"
+            payload = {
+                "state_topic": state_topic,
+                "value_template": f"{{{{ value_json.{key} }}}}",
+                "state_class": "measurement",
+                "name": unique_id,
+                "object_id": unique_id,
+                "unique_id": unique_id,
+                "device": {
+                    "identifiers": [self._mqtt_name],
+                    "name": self._mqtt_name,
+                }
+            }
+            self._mqtt_client.publish(
+                f"homeassistant/sensor/{unique_id}/config",
+                json.dumps(payload, sort_keys=True),
+                retain=True
+            )
+            self._announced.add(key)
+
+        self._mqtt_client.publish(state_topic, json.dumps(snapshot, sort_keys=True), retain=True)
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.export()
+
+            except Exception:
+                self.logger.exception("failed to export metrics")
+
+
+metrics = MetricsRegistry()
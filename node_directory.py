@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from logging import Logger
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from meshtastic.mesh_interface import MeshInterface
+from pubsub import pub
+
+from metrics import metrics
+
+
+class NodeEntry:
+    __slots__ = ("num", "long_name", "short_name", "latitude", "longitude", "precision_bits", "last_heard")
+
+    def __init__(self, num: int):
+        self.num = num
+        self.long_name = None
+        self.short_name = None
+        self.latitude = None
+        self.longitude = None
+        self.precision_bits = None
+        self.last_heard = None
+
+    @property
+    def id(self) -> str:
+        return f"!{self.num:08x}"
+
+
+class NodeDirectory:
+
+    def __init__(self, logger: Logger = None):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        # node number -> entry
+        self._nodes: Dict[int, NodeEntry] = {}
+        self._subscribed = False
+        metrics.gauge("nodes_known", "nodes in the node directory", self.__len__)
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def pubsub_subscribe(self):
+        if self._subscribed:
+            return
+
+        self.logger.info("subscribing to node updates")
+        pub.subscribe(self._on_node_updated, "meshtastic.node.updated")
+        pub.subscribe(self._on_connection_established, "meshtastic.connection.established")
+        pub.subscribe(self._on_receive, "meshtastic.receive")
+        self._subscribed = True
+
+    @staticmethod
+    def node_num(node_id) -> Optional[int]:
+        if isinstance(node_id, int):
+            return node_id
+
+        if isinstance(node_id, str) and node_id.startswith("!"):
+            try:
+                return int(node_id[1:], 16)
+
+            except ValueError:
+                return None
+
+        return None
+
+    def get(self, node_id) -> Optional[NodeEntry]:
+        num = self.node_num(node_id)
+        return self._nodes.get(num) if num is not None else None
+
+    def _entry(self, num: int) -> NodeEntry:
+        entry = self._nodes.get(num)
+        if entry is None:
+            with self._lock:
+                entry = self._nodes.setdefault(num, NodeEntry(num))
+
+        return entry
+
+    def _lookup(self, node_id, interface: Optional[MeshInterface], attr: str) -> Optional[NodeEntry]:
+        entry = self.get(node_id)
+        if entry is None or getattr(entry, attr) is None:
+            entry = self._load_missing(node_id, interface) or entry
+
+        return entry
+
+    def long_name(self, node_id, interface: MeshInterface = None) -> str:
+        entry = self._lookup(node_id, interface, "long_name")
+        return (entry.long_name or node_id) if entry is not None else node_id
+
+    def short_name(self, node_id, interface: MeshInterface = None) -> str:
+        entry = self._lookup(node_id, interface, "short_name")
+        return (entry.short_name or node_id) if entry is not None else node_id
+
+    def position(self, node_id, interface: MeshInterface = None) -> Optional[Tuple[float, float]]:
+        entry = self._lookup(node_id, interface, "latitude")
+        if entry is not None and entry.latitude is not None and entry.longitude is not None:
+            return entry.latitude, entry.longitude
+
+        return None
+
+    def last_heard(self, node_id) -> Optional[int]:
+        entry = self.get(node_id)
+        return entry.last_heard if entry is not None else None
+
+    def _load_missing(self, node_id, interface: Optional[MeshInterface]) -> Optional[NodeEntry]:
+        # nodes the interface knew about before we subscribed
+        if interface is None or not isinstance(node_id, str):
+            return None
+
+        node = interface.nodes.get(node_id) if interface.nodes else None
+        if node is None:
+            return None
+
+        return self.update_node(node)
+
+    def load(self, interface: MeshInterface):
+        nodes = interface.nodes or {}
+        for node in list(nodes.values()):
+            self.update_node(node)
+
+        self.logger.info(f"loaded {len(nodes)} nodes, {len(self._nodes)} known")
+
+    def update_node(self, node: dict) -> Optional[NodeEntry]:
+        num = node.get("num")
+        if num is None:
+            num = self.node_num(node.get("user", {}).get("id"))
+            if num is None:
+                return None
+
+        entry = self._entry(num)
+        user = node.get("user")
+        if user:
+            self._update_user(entry, user)
+
+        position = node.get("position")
+        if position:
+            self._update_position(entry, position)
+
+        last_heard = node.get("lastHeard")
+        if last_heard:
+            entry.last_heard = max(entry.last_heard or 0, last_heard)
+
+        return entry
+
+    @staticmethod
+    def _update_user(entry: NodeEntry, user: dict):
+        long_name, short_name = user.get("longName"), user.get("shortName")
+        if long_name:
+            entry.long_name = long_name
+        if short_name:
+            entry.short_name = short_name
+
+    @staticmethod
+    def _update_position(entry: NodeEntry, position: dict):
+        latitude = position.get("latitude")
+        longitude = position.get("longitude")
+        if latitude is None and "latitudeI" in position:
+            latitude = position["latitudeI"] * 1e-7
+        if longitude is None and "longitudeI" in position:
+            longitude = position["longitudeI"] * 1e-7
+
+        if latitude is not None and longitude is not None:
+            entry.latitude, entry.longitude = latitude, longitude
+            entry.precision_bits = position.get("precisionBits", entry.precision_bits)
+
+    def _on_node_updated(self, node: dict, interface: MeshInterface):
+        self.update_node(node)
+
+    def _on_connection_established(self, interface: MeshInterface):
+        self.load(interface)
+
+    def _on_receive(self, packet: dict, interface: MeshInterface):
+        num = packet.get("from")
+        if num is None:
+            return
+
+        entry = self._entry(num)
+        entry.last_heard = packet.get("rxTime") or int(time.time())
+
+        decoded = packet.get("decoded")
+        if decoded:
+            if "user" in decoded:
+                self._update_user(entry, decoded["user"])
+
+            elif "position" in decoded:
+                self._update_position(entry, decoded["position"])
+
+
+node_directory = NodeDirectory()
@@ -0,0 +1,70 @@
+import threading
+import time
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from config_check import ConfigCheck
+
+
+class RateLimiter:
+
+    def __init__(self, burst: int, interval: float, notice: bool = True):
+        self._burst = burst
+        self._interval = interval
+        self._notice = notice
+        self._lock = threading.Lock()
+
+        # key -> (tokens, last update, notice sent), a bucket left alone for `burst * interval` is full again
+        # and is dropped, so only recently active senders take memory
+        self._buckets: Dict[str, Tuple[float, float, bool]] = {}
+        self._idle = burst * interval
+        self._next_sweep = time.monotonic() + self._idle
+
+    @classmethod
+    def from_config(cls, config_check: ConfigCheck) -> Optional["RateLimiter"]:
+        burst = config_check.get("rate_burst", 0, int)
+        if burst <= 0:
+            return None
+
+        interval = config_check.get("rate_interval", 60, (int, float))
+        if interval <= 0:
+            config_check.fail(f"config error: 'rate_interval' must be positive")
+
+        return cls(burst, interval, config_check.get("rate_notice", True, bool))
+
+    @property
+    def burst(self) -> int:
+        return self._burst
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key: str) -> Tuple[bool, bool]:
+        # (allowed, first refusal since the bucket was last allowed)
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens, noticed = self._burst, False
+            else:
+                tokens = min(self._burst, bucket[0] + (now - bucket[1]) / self._interval)
+                noticed = bucket[2]
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, False)
+                return True, False
+
+            self._buckets[key] = (tokens, now, True)
+            return False, self._notice and not noticed
+
+    def _sweep(self, now: float):
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < self._idle}
+        self._next_sweep = now + self._idle
@@ -0,0 +1,248 @@
+import logging
+import math
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections import deque
+from logging import Logger
+from typing import Dict
+from typing import Optional
+
+from meshtastic.mesh_interface import MeshInterface
+
+from config_check import ConfigCheck
+from metrics import metrics
+
+
+class SendLane:
+    # the replies waiting for one radio, sent by their own thread so a slow preset or a hung radio only delays itself
+    __slots__ = ("interface", "cond", "queues", "thread")
+
+    def __init__(self, interface: MeshInterface, lock: threading.Lock, priorities: int):
+        self.interface = interface
+        self.cond = threading.Condition(lock)
+        # one OrderedDict per priority class: (destination, channel) -> FIFO of text,
+        # destinations are served round robin within a class
+        self.queues = [OrderedDict() for _ in range(priorities)]
+        self.thread: Optional[threading.Thread] = None
+
+    def pending(self) -> int:
+        return sum(len(q) for queues in self.queues for q in queues.values())
+
+
+class SendScheduler:
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+    PRIORITIES = {"high": HIGH, "normal": NORMAL, "low": LOW}
+
+    # modem preset: spreading factor, bandwidth(Hz), coding rate denominator
+    MODEM_PRESETS = {
+        "SHORT_TURBO": (7, 500000, 5),
+        "SHORT_FAST": (7, 250000, 5),
+        "SHORT_SLOW": (8, 250000, 5),
+        "MEDIUM_FAST": (9, 250000, 5),
+        "MEDIUM_SLOW": (10, 250000, 5),
+        "LONG_FAST": (11, 250000, 5),
+        "LONG_MODERATE": (11, 125000, 8),
+        "LONG_SLOW": (12, 125000, 8),
+        "VERY_LONG_SLOW": (12, 62500, 8),
+    }
+    PREAMBLE_SYMBOLS = 16
+    # meshtastic packet header plus the protobuf envelope around the text
+    PACKET_OVERHEAD = 16 + 12
+    # room for a reply prefix, a "[i/n] " marker and some text
+    MIN_PAYLOAD = 32
+
+    def __init__(self, config: dict, logger: Logger = None):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+
+        config_check = ConfigCheck(config, self.__class__.__name__, None, self.logger, optional=True)
+
+        modem_preset = config_check.get("modem_preset", "LONG_FAST", str).upper()
+        if modem_preset not in self.MODEM_PRESETS:
+            config_check.fail(f"config error: unsupported 'modem_preset' {modem_preset}")
+
+        self._modem_preset = modem_preset
+        self._max_payload = config_check.get("max_payload", 200, int)
+        if self._max_payload < self.MIN_PAYLOAD:
+            config_check.fail(f"config error: 'max_payload' must be at least {self.MIN_PAYLOAD}")
+        self._coalesce = config_check.get("coalesce", True, bool)
+        self._burst_airtime = config_check.get("burst_airtime", 10.0, (int, float))
+        self._airtime_rate = config_check.get("airtime_rate", 0.1, (int, float))
+        if self._burst_airtime <= 0 or self._airtime_rate <= 0:
+            config_check.fail(f"config error: 'burst_airtime' and 'airtime_rate' must be positive")
+
+        self._lock = threading.Lock()
+        # interface -> lane, a lane is dropped once its thread has nothing left to send
+        self._lanes: Dict[MeshInterface, SendLane] = {}
+        # per interface token bucket in seconds of airtime: (tokens, last refill), it outlives the lanes
+        self._buckets = weakref.WeakKeyDictionary()
+        # radios on another preset than `modem_preset`, forgotten with their interface
+        self._modem_presets = weakref.WeakKeyDictionary()
+        self._started = False
+
+        self._metric_sent = metrics.counter("packets_sent_total", "packets sent to the mesh")
+        self._metric_coalesced = metrics.counter("packets_coalesced_total", "replies merged into another packet")
+        self._metric_airtime = metrics.counter("send_airtime_seconds_total", "estimated airtime of sent packets")
+        metrics.gauge("send_pending", "replies waiting to be sent", self.pending)
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    @property
+    def max_payload(self) -> int:
+        return self._max_payload
+
+    def set_modem_preset(self, interface: MeshInterface, modem_preset: str):
+        with self._lock:
+            self._modem_presets[interface] = modem_preset.upper()
+
+    def airtime(self, payload_size: int, modem_preset: str = None) -> float:
+        # https://www.semtech.com/design-support/lora-calculator
+        sf, bw, cr = self.MODEM_PRESETS[modem_preset or self._modem_preset]
+        symbol_time = (2 ** sf) / bw
+        low_data_rate = 1 if symbol_time > 0.016 else 0
+        size = payload_size + self.PACKET_OVERHEAD
+
+        payload_symbols = math.ceil((8 * size - 4 * sf + 28 + 16) / (4 * (sf - 2 * low_data_rate)))
+        payload_symbols = 8 + max(payload_symbols * cr, 0)
+        return (self.PREAMBLE_SYMBOLS + 4.25 + payload_symbols) * symbol_time
+
+    def start(self):
+        with self._lock:
+            self._started = True
+            for lane in self._lanes.values():
+                self._start_lane(lane)
+
+        self.logger.info(
+            f"started: {self._modem_preset}, burst {self._burst_airtime}s, "
+            f"rate {self._airtime_rate}s/s, max payload {self._max_payload}B"
+        )
+
+    def stop(self, timeout: float = None):
+        # lanes still drain what was queued, new replies wait for the next start
+        with self._lock:
+            self._started = False
+            threads = [lane.thread for lane in self._lanes.values() if lane.thread is not None]
+            for lane in self._lanes.values():
+                lane.cond.notify_all()
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def _start_lane(self, lane: SendLane):
+        if lane.thread is None:
+            lane.thread = threading.Thread(target=self._run, args=(lane,), name=self.__class__.__name__, daemon=True)
+            lane.thread.start()
+
+    def send(
+            self,
+            interface: MeshInterface,
+            text: str,
+            destination_id,
+            channel_index: int = 0,
+            priority: int = NORMAL
+    ):
+        with self._lock:
+            lane = self._lanes.get(interface)
+            if lane is None:
+                lane = self._lanes[interface] = SendLane(interface, self._lock, len(self.PRIORITIES))
+
+            lane.queues[priority].setdefault((destination_id, channel_index), deque()).append(text)
+            if self._started:
+                self._start_lane(lane)
+
+            lane.cond.notify()
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(lane.pending() for lane in self._lanes.values())
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "sent": self._metric_sent.value,
+            "coalesced": self._metric_coalesced.value,
+            "airtime": self._metric_airtime.value,
+        }
+
+    def _pop_next(self, lane: SendLane):
+        for priority, queues in enumerate(lane.queues):
+            if queues:
+                key, fifo = queues.popitem(last=False)
+                text = fifo.popleft()
+
+                # merge following small replies to the same destination while they fit
+                while self._coalesce and fifo:
+                    merged = f"{text}\n{fifo[0]}"
+                    if len(merged.encode("utf-8")) > self._max_payload:
+                        break
+
+                    text = merged
+                    fifo.popleft()
+                    self._metric_coalesced.inc()
+
+                if fifo:
+                    queues[key] = fifo
+
+                return priority, key, text
+
+        return None
+
+    @staticmethod
+    def _push_front(lane: SendLane, priority: int, key: tuple, text: str):
+        queues = lane.queues[priority]
+        queues.setdefault(key, deque()).appendleft(text)
+        queues.move_to_end(key, last=False)
+
+    def _take_airtime(self, interface: MeshInterface, airtime: float) -> float:
+        # returns the seconds to wait before `airtime` is available, consuming it when 0
+        now = time.monotonic()
+        tokens, last = self._buckets.get(interface, (self._burst_airtime, now))
+        tokens = min(self._burst_airtime, tokens + (now - last) * self._airtime_rate)
+
+        needed = min(airtime, self._burst_airtime)
+        if tokens < needed:
+            self._buckets[interface] = (tokens, now)
+            return (needed - tokens) / self._airtime_rate
+
+        self._buckets[interface] = (tokens - airtime, now)
+        return 0.0
+
+    def _run(self, lane: SendLane):
+        interface = lane.interface
+        while True:
+            with self._lock:
+                job = self._pop_next(lane)
+                if job is None:
+                    # the next reply starts a new lane, an idle thread never keeps a closed interface alive
+                    del self._lanes[interface]
+                    lane.thread = None
+                    return
+
+                priority, key, text = job
+                destination_id, channel_index = key
+                airtime = self.airtime(len(text.encode("utf-8")), self._modem_presets.get(interface))
+                delay = self._take_airtime(interface, airtime)
+                if delay > 0:
+                    # put it back so it can still absorb replies and yield to higher priorities
+                    self._push_front(lane, priority, key, text)
+                    lane.cond.wait(delay)
+                    continue
+
+            try:
+                interface.sendText(
+                    text,
+                    destinationId=destination_id,
+                    channelIndex=channel_index,
+                    wantAck=False
+                )
+                self._metric_sent.inc()
+                self._metric_airtime.inc(airtime)
+
+            except Exception:
+                self.logger.exception(f"failed to send to {destination_id}")
+
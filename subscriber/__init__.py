@@ -1,2 +1,16 @@
 from .cmd import CmdSubscriber
 from .mqtt import MqttSubscriber
+from .router import PacketRouter
+
+
+def __getattr__(name: str):
+    # optional subscribers pull in their own dependencies, they are imported on first use
+    if name == "JournalSubscriber":
+        from .journal import JournalSubscriber
+        return JournalSubscriber
+
+    if name == "RecorderSubscriber":
+        from .recorder import RecorderSubscriber
+        return RecorderSubscriber
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,140 @@
+import logging
+import threading
+from array import array
+from logging import Logger
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+
+class RingBuffer:
+    __slots__ = ("_values", "_index", "_size", "_pending")
+
+    def __init__(self, capacity: int):
+        self._values = array("d", bytes(8 * capacity))
+        self._index = 0
+        self._size = 0
+        # samples appended since the last summary
+        self._pending = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._values)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value: float):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % len(self._values)
+        self._size = min(self._size + 1, len(self._values))
+        self._pending += 1
+
+    def recent(self, count: int) -> array:
+        count = min(count, self._size)
+        if count <= self._index:
+            return self._values[self._index - count:self._index]
+
+        return self._values[len(self._values) - (count - self._index):] + self._values[:self._index]
+
+    def summary(self) -> Tuple[float, float, float, float]:
+        # min, max, mean and last of the samples since the previous summary
+        values = self.recent(self._pending)
+        self._pending = 0
+        return min(values), max(values), sum(values) / len(values), values[-1]
+
+
+class TelemetryAggregator:
+    STATS = ("min", "max", "mean")
+
+    def __init__(
+            self,
+            publish: Callable[[str, dict], bool],
+            interval: float,
+            window: int = 64,
+            logger: Logger = None
+    ):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._publish = publish
+        self._interval = interval
+        self._window = window
+
+        self._lock = threading.Lock()
+        # state topic -> field -> samples
+        self._buffers: Dict[str, Dict[str, RingBuffer]] = {}
+        # state topic -> latest non numeric values
+        self._latest: Dict[str, dict] = {}
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+        self.logger.info(f"aggregating telemetry every {self._interval}s over up to {self._window} samples")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def add(self, state_topic: str, values: dict):
+        with self._lock:
+            buffers = self._buffers.setdefault(state_topic, {})
+            latest = self._latest.setdefault(state_topic, {})
+            for field, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    buffer = buffers.get(field)
+                    if buffer is None:
+                        buffer = buffers[field] = RingBuffer(self._window)
+                    buffer.append(value)
+
+                else:
+                    latest[field] = value
+
+    def _collect(self) -> Dict[str, dict]:
+        aggregates = {}
+        with self._lock:
+            for state_topic, buffers in self._buffers.items():
+                if not any(buffer.pending for buffer in buffers.values()):
+                    continue
+
+                values = dict(self._latest[state_topic])
+                for field, buffer in buffers.items():
+                    if not len(buffer):
+                        continue
+
+                    if buffer.pending:
+                        minimum, maximum, mean, last = buffer.summary()
+                    else:
+                        minimum = maximum = mean = last = buffer.recent(1)[0]
+
+                    values[field] = last
+                    values[f"{field}_min"] = minimum
+                    values[f"{field}_max"] = maximum
+                    values[f"{field}_mean"] = round(mean, 6)
+
+                aggregates[state_topic] = values
+
+        return aggregates
+
+    def flush(self):
+        # published outside the lock so a slow broker does not stall the receive path
+        for state_topic, values in self._collect().items():
+            self._publish(state_topic, values)
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.flush()
+
+            except Exception:
+                self.logger.exception("failed to publish aggregated telemetry")
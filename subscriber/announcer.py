@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+from logging import Logger
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import paho.mqtt.client as mqtt
+
+from discovery import DISCOVERIES
+from discovery import aggregate_payload
+from discovery import payload_field
+from metrics import metrics
+
+
+class DiscoveryAnnouncer:
+
+    def __init__(
+            self,
+            mqtt_client: mqtt.Client,
+            state_path: Optional[str] = None,
+            aggregates: Tuple[str, ...] = (),
+            logger: Logger = None
+    ):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._mqtt_client = mqtt_client
+        self._state_path = state_path
+        self._aggregates = aggregates
+        self._lock = threading.Lock()
+
+        # (group, node id) -> [(topic, field, serialized payload)]
+        self._payloads: Dict[Tuple[str, str], List[Tuple[str, Optional[str], str]]] = {}
+        # (group, node id) -> fields already announced
+        self._seen: Dict[Tuple[str, str], set] = {}
+        self._announced = self._load()
+
+        self._metric_announced = metrics.counter("discovery_announced_total", "discovery configs published")
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    @property
+    def announced(self) -> set:
+        return set(self._announced)
+
+    def _load(self) -> set:
+        if not self._state_path or not os.path.isfile(self._state_path):
+            return set()
+
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as fd:
+                announced = set(json.load(fd))
+
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning(f"ignoring {self._state_path}: {e}")
+            return set()
+
+        self.logger.info(f"{len(announced)} discovery topics already announced")
+        return announced
+
+    def _save(self):
+        if not self._state_path:
+            return
+
+        tmp_path = f"{self._state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fd:
+            json.dump(sorted(self._announced), fd, indent=0)
+
+        os.replace(tmp_path, self._state_path)
+
+    def _get_payloads(self, group: str, node_id: str) -> List[Tuple[str, Optional[str], str]]:
+        key = (group, node_id)
+        payloads = self._payloads.get(key)
+        if payloads is None:
+            payloads = []
+            for topic, payload in DISCOVERIES[group](node_id):
+                field = payload_field(payload)
+                payloads.append((topic, field, json.dumps(payload, sort_keys=True)))
+                if field is not None:
+                    for stat in self._aggregates:
+                        aggregate_topic, aggregate = aggregate_payload(payload, field, stat)
+                        payloads.append((aggregate_topic, field, json.dumps(aggregate, sort_keys=True)))
+
+            self._payloads[key] = payloads
+            self._seen[key] = {field for _, field, _ in payloads if self._is_announced(payloads, field)}
+
+        return payloads
+
+    def _is_announced(self, payloads: List[Tuple[str, Optional[str], str]], field: Optional[str]) -> bool:
+        return all(topic in self._announced for topic, f, _ in payloads if f == field)
+
+    def announce(self, group: str, node_id: str, fields: Iterable[str] = ()):
+        # hot path, every field of this packet was already handled
+        seen = self._seen.get((group, node_id))
+        if seen is not None and seen.issuperset(fields) and None in seen:
+            return
+
+        with self._lock:
+            payloads = self._get_payloads(group, node_id)
+            seen = self._seen[(group, node_id)]
+            present = set(fields)
+            present.add(None)
+
+            published = []
+            for topic, field, payload in payloads:
+                if field not in present or topic in self._announced:
+                    continue
+
+                info = self._mqtt_client.publish(topic, payload, qos=1, retain=True)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    self.logger.warning(f"failed to announce {topic}: {mqtt.error_string(info.rc)}")
+                    continue
+
+                self._announced.add(topic)
+                published.append(topic)
+
+            # fields without a sensor are remembered too, they are not looked up again
+            seen.update(f for f in present if self._is_announced(payloads, f))
+
+            if published:
+                self._metric_announced.inc(len(published))
+                self.logger.info(f"announced {len(published)} {group} topics for {node_id}")
+                self._save()
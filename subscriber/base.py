@@ -1,10 +1,16 @@
+import functools
 import logging
+import time
 from logging import Logger
+from typing import FrozenSet
 from typing import List
+from typing import Optional
 
 from meshtastic.mesh_interface import MeshInterface
 from pubsub import pub
 
+from metrics import metrics
+
 
 class BaseSubscriber:
 
@@ -12,9 +18,51 @@ class BaseSubscriber:
         self._default_topic = default_topic
         self._logger = logger or logging.getLogger(self.__class__.__name__)
 
+        name = self.__class__.__name__
+        self._metric_packets = metrics.counter("subscriber_packets_total", "packets handled", subscriber=name)
+        self._metric_errors = metrics.counter("subscriber_errors_total", "packets that raised", subscriber=name)
+        self._metric_latency = metrics.histogram("subscriber_latency_seconds", "packet handler latency", subscriber=name)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every subscriber's handler is timed, functools.wraps keeps the signature pubsub inspects
+        for name in ("__call__", "route"):
+            handler = cls.__dict__.get(name)
+            if handler is not None:
+                setattr(cls, name, cls._instrumented(handler))
+
+    @staticmethod
+    def _instrumented(call):
+        @functools.wraps(call)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            self._metric_packets.inc()
+            try:
+                return call(self, *args, **kwargs)
+
+            except Exception:
+                self._metric_errors.inc()
+                raise
+
+            finally:
+                self._metric_latency.observe(time.perf_counter() - start)
+
+        return wrapper
+
     def __call__(self, packet: dict, interface: MeshInterface):
         raise NotImplementedError()
 
+    def route(self, packet: dict, interface: MeshInterface, portnum: Optional[str], from_id: Optional[str]):
+        # called by the PacketRouter with the fields it already read, the packet matched portnums and from_ids
+        return self(packet, interface)
+
+    def register_metrics(self):
+        # called once the subscriber is routed to, after the subscribers it replaces were closed
+        pass
+
+    def close(self):
+        pass
+
     def pubsub_subscribe(self, topic: str = None):
         topic = topic or self.default_topic
         self.logger.info(f"subscribing to {topic}")
@@ -28,6 +76,15 @@ class BaseSubscriber:
     def default_topic(self) -> str:
         return self._default_topic
 
+    @property
+    def portnums(self) -> Optional[FrozenSet[str]]:
+        # what the PacketRouter hands to this subscriber, None for any portnum or sender
+        return None
+
+    @property
+    def from_ids(self) -> Optional[FrozenSet[str]]:
+        return None
+
     @staticmethod
     def dict_get(d: dict, path: List[str] | str, default=None):
 
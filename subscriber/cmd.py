@@ -1,28 +1,27 @@
-import re
+import logging
+from typing import FrozenSet
 
 from meshtastic.mesh_interface import MeshInterface
 
-from cmd import EchoCmd
-from cmd import ManCmd
-from cmd import NoaaCmd
-from cmd import PingCmd
-from cmd import RollCmd
-from cmd import TopCmd
+from acl import AccessRule
+from cmd import BaseCmd
+from cmd import CmdDispatcher
+from cmd import CmdExecutor
+from cmd import cmd_registry
 from config_check import ConfigCheck
 from interface_utils import get_long_name
+from metrics import metrics
+from rate_limiter import RateLimiter
+from send_scheduler import SendScheduler
 from .base import BaseSubscriber
 
 
 class CmdSubscriber(BaseSubscriber):
-    _cmds = [
-        EchoCmd,
-        NoaaCmd,
-        PingCmd,
-        RollCmd,
-        TopCmd,
-    ]
-
-    def __init__(self, config: dict):
+    PORTNUMS = frozenset({"TEXT_MESSAGE_APP"})
+    # built with the other cmds help lines, so it is created last
+    _man_cmd = "ManCmd"
+
+    def __init__(self, config: dict, scheduler: SendScheduler = None):
         super().__init__(default_topic="meshtastic.receive.text")
 
         config_check = ConfigCheck(
@@ -33,54 +32,119 @@ class CmdSubscriber(BaseSubscriber):
         )
 
         self._escape = config_check["escape"]
-        self._blacklist = config_check.get("blacklist", [], list).copy()
-        self._whitelist = config_check.get("whitelist", [], list).copy()
-        if self._blacklist and self._whitelist:
-            self.logger.error(f"config error: 'blacklist' and 'whitelist' are mutually exclusive")
-            exit(1)
+        # applies to every cmd, checked before the cmd's own rule
+        self._access_rule = AccessRule.from_config(config, config_check)
+
+        # shared by every cmd, each cmd can have its own limiter too
+        self._rate_limiter = RateLimiter.from_config(config_check)
 
         self._cmd_list = []
-        for cmd in self._cmds:
-            if cmd.__name__ in config:
-                self._cmd_list.append(cmd(config=config))
+        for name in cmd_registry.names():
+            if name == self._man_cmd:
+                continue
+
+            if name in config:
+                self._cmd_list.append(cmd_registry.load(name)(config=config))
             else:
-                self.logger.info(f"cmd disabled: {cmd.__name__}")
+                self.logger.info(f"cmd disabled: {name}")
+
+        for name in config:
+            if name.endswith("Cmd") and name not in cmd_registry:
+                self.logger.warning(f"unknown cmd: [{name}] is not a built-in cmd or an installed plugin")
 
-        if ManCmd.__name__ in config:
-            man_cmd = ManCmd(config=config, cmds=self._cmd_list, escape=self.escape)
+        if self._man_cmd in config:
+            man_cmd = cmd_registry.load(self._man_cmd)(config=config, cmds=self._cmd_list, escape=self.escape)
             self._cmd_list.append(man_cmd)
 
         else:
-            self.logger.info(f"cmd disabled: {ManCmd.__name__}")
+            self.logger.info(f"cmd disabled: {self._man_cmd}")
 
-    def check_access(self, from_id: str) -> bool:
-        if not self._blacklist and not self._whitelist:
-            return True
-        elif from_id not in self._blacklist:
-            return True
-        elif from_id in self._whitelist:
-            return True
-        else:
-            return False
+        for cmd in self._cmd_list:
+            cmd.scheduler = scheduler
+
+        self._dispatcher = CmdDispatcher(self.escape, self._cmd_list)
+
+        queue_policy = config_check.get("queue_policy", CmdExecutor.DROP_OLDEST, str)
+        if queue_policy not in CmdExecutor.POLICIES:
+            config_check.fail(f"config error: 'queue_policy' must be one of {', '.join(CmdExecutor.POLICIES)}")
+
+        self._executor = CmdExecutor(
+            workers=config_check.get("workers", 2, int),
+            queue_size=config_check.get("queue_size", 16, int),
+            policy=queue_policy
+        )
+        self._executor.start()
+
+    def check_access(self, cmd: BaseCmd, packet: dict, interface: MeshInterface) -> bool:
+        from_id = packet["fromId"]
+        allowed, reason = self._access_rule.check(
+            from_id,
+            packet.get("channel", 0),
+            cmd.is_packet_dm(packet, interface)
+        )
+        logger = self.logger
+        if allowed:
+            allowed, reason = cmd.check_access(packet, interface)
+            logger = cmd.logger
+
+        if not allowed:
+            logger.info(f"access denied for {get_long_name(interface, from_id)}({from_id}): {reason}")
+
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"access granted for {from_id}: {reason}")
+
+        return allowed
+
+    def register_metrics(self):
+        self._executor.register_metrics()
+        for cmd in self._cmd_list:
+            cmd.register_metrics()
+
+    def close(self):
+        # commands already queued still get their reply
+        self._executor.stop()
+        self._executor.unregister_metrics()
+        for cmd in self._cmd_list:
+            cmd.unregister_metrics()
+
+    @property
+    def portnums(self) -> FrozenSet[str]:
+        return self.PORTNUMS
 
     @property
     def escape(self) -> str:
         return self._escape
 
-    def __call__(self, packet: dict, interface: MeshInterface):
-        from_id = packet["fromId"]
-        from_name = get_long_name(interface, from_id)
-        text = packet["decoded"]["text"]
+    @property
+    def executor(self) -> CmdExecutor:
+        return self._executor
 
-        if self.check_access(from_id):
-            for cmd in self._cmd_list:
-                if re.match(rf"^\s*{self.escape}{cmd.key}.*", text):
-                    if cmd.check_access(from_id):
-                        cmd(self.escape, packet, interface)
+    @staticmethod
+    def _check_rate(rate_limiter: RateLimiter, cmd: BaseCmd, packet: dict, interface: MeshInterface) -> bool:
+        if rate_limiter is None:
+            return True
 
-                    else:
-                        cmd.logger.info(f"access denied for {from_name}({from_id})")
+        allowed, notice = rate_limiter.acquire(packet["fromId"])
+        if allowed:
+            return True
 
-                    break
-        else:
-            self.logger.info(f"access denied for {from_name}({from_id})")
+        metrics.counter("cmd_rate_limited_total", "commands refused by a rate limit", cmd=cmd.key).inc()
+        cmd.logger.info(f"rate limited {get_long_name(interface, packet['fromId'])}({packet['fromId']})")
+        if notice:
+            cmd.send_reply(["rate limited, try again later"], packet, interface)
+
+        return False
+
+    def __call__(self, packet: dict, interface: MeshInterface):
+        match = self._dispatcher.parse(packet["decoded"]["text"])
+        if match is None:
+            return
+
+        cmd, args = match
+        if not self.check_access(cmd, packet, interface):
+            return
+
+        if self._check_rate(self._rate_limiter, cmd, packet, interface) and \
+                self._check_rate(cmd.rate_limiter, cmd, packet, interface):
+            if not self._executor.submit(cmd, lambda: cmd.invoke(self.escape, packet, interface, args)):
+                cmd.send_reply(["busy, try again later"], packet, interface)
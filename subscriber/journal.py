@@ -0,0 +1,184 @@
+import queue
+import threading
+import time
+
+from meshtastic.mesh_interface import MeshInterface
+from peewee import DatabaseProxy
+from peewee import FloatField
+from peewee import IntegerField
+from peewee import Model
+from peewee import SqliteDatabase
+from peewee import TextField
+
+from config_check import ConfigCheck
+from metrics import metrics
+from .base import BaseSubscriber
+
+database_proxy = DatabaseProxy()
+
+
+class JournalPacket(Model):
+    packet_id = IntegerField(null=True)
+    from_id = TextField(null=True)
+    to_id = TextField(null=True)
+    portnum = TextField(null=True)
+    channel = IntegerField(default=0)
+    rx_time = IntegerField()
+    snr = FloatField(null=True)
+    hops = IntegerField(null=True)
+    text = TextField(null=True)
+
+    class Meta:
+        database = database_proxy
+        table_name = "packet"
+        indexes = (
+            (("from_id", "rx_time"), False),
+            (("rx_time",), False),
+        )
+
+
+class JournalSubscriber(BaseSubscriber):
+    WRITE_ATTEMPTS = 3
+    _fields = ("packet_id", "from_id", "to_id", "portnum", "channel", "rx_time", "snr", "hops", "text")
+
+    def __init__(self, config: dict):
+        super().__init__(default_topic="meshtastic.receive")
+
+        journal_config = ConfigCheck(config, self.__class__.__name__, None, self.logger)
+
+        self._path = journal_config.get("path", "meshEcho.db", str)
+        self._retention = journal_config.get("retention_days", 30, int) * 24 * 60 * 60
+        self._batch_size = journal_config.get("batch_size", 100, int)
+        self._flush_interval = journal_config.get("flush_interval", 5, (int, float))
+
+        self._queue = queue.Queue(maxsize=journal_config.get("queue_size", 10000, int))
+        self._dropped = 0
+        self._written = 0
+        # cleared when the database can't be opened, packets are no longer queued
+        self._enabled = True
+        metrics.gauge("journal_pending", "packets waiting to be journaled", self._queue.qsize)
+        metrics.gauge("journal_written", "packets journaled", lambda: self._written)
+        metrics.gauge("journal_dropped", "packets dropped from a full journal queue", lambda: self._dropped)
+
+        self._database = SqliteDatabase(
+            self._path,
+            pragmas={
+                "journal_mode": "wal",
+                "synchronous": "normal",
+            }
+        )
+        database_proxy.initialize(self._database)
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._writer, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    @property
+    def database(self) -> SqliteDatabase:
+        return self._database
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._enabled,
+            "pending": self._queue.qsize(),
+            "written": self._written,
+            "dropped": self._dropped,
+        }
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        self._thread.join(timeout)
+
+    def __call__(self, packet: dict, interface: MeshInterface):
+        if not self._enabled:
+            return
+
+        decoded = packet.get("decoded", {})
+        hop_start, hop_limit = packet.get("hopStart"), packet.get("hopLimit")
+
+        row = (
+            packet.get("id"),
+            packet.get("fromId"),
+            packet.get("toId"),
+            decoded.get("portnum"),
+            packet.get("channel", 0),
+            packet.get("rxTime") or int(time.time()),
+            packet.get("rxSnr"),
+            hop_start - hop_limit if hop_start is not None and hop_limit is not None else None,
+            decoded.get("text"),
+        )
+
+        try:
+            self._queue.put_nowait(row)
+
+        except queue.Full:
+            self._dropped += 1
+
+    def _prune(self):
+        cutoff = int(time.time()) - self._retention
+        deleted = JournalPacket.delete().where(JournalPacket.rx_time < cutoff).execute()
+        if deleted:
+            self.logger.info(f"pruned {deleted} packets older than {self._retention // (24 * 60 * 60)} days")
+
+    def _write(self, rows: list):
+        with self._database.atomic():
+            JournalPacket.insert_many(rows, fields=[getattr(JournalPacket, f) for f in self._fields]).execute()
+
+        self._written += len(rows)
+
+    def _writer(self):
+        try:
+            self._database.connect(reuse_if_open=True)
+            self._database.create_tables([JournalPacket])
+
+        except Exception:
+            self._enabled = False
+            self.logger.exception(f"failed to open {self._path}, journaling disabled")
+            self._database.close()
+            return
+
+        self.logger.info(f"journaling packets to {self._path}")
+
+        prune_interval = 60 * 60
+        next_prune = time.monotonic()
+
+        while not self._stop_event.is_set() or not self._queue.empty():
+            if time.monotonic() >= next_prune:
+                # a locked database is retried at the next interval, the writer keeps running
+                try:
+                    self._prune()
+
+                except Exception:
+                    self.logger.exception("failed to prune the journal")
+
+                next_prune = time.monotonic() + prune_interval
+
+            try:
+                rows = [self._queue.get(timeout=self._flush_interval)]
+
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self._flush_interval
+            while len(rows) < self._batch_size:
+                try:
+                    rows.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+
+                except queue.Empty:
+                    break
+
+            # a locked database usually frees up within seconds, the batch is dropped after the last attempt
+            for attempt in range(1, self.WRITE_ATTEMPTS + 1):
+                try:
+                    self._write(rows)
+                    break
+
+                except Exception as e:
+                    if attempt == self.WRITE_ATTEMPTS:
+                        self._dropped += len(rows)
+                        self.logger.exception(f"failed to write {len(rows)} packets, dropping them")
+                    else:
+                        self.logger.warning(f"failed to write {len(rows)} packets, retrying: {e!r}")
+                        self._stop_event.wait(attempt)
+
+        self._database.close()
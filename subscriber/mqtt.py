@@ -1,116 +1,189 @@
-import json
-import sys
+from typing import FrozenSet
+from typing import List
 
 import paho.mqtt.client as mqtt
 from meshtastic.mesh_interface import MeshInterface
 
 from config_check import ConfigCheck
+from node_directory import node_directory
+from .aggregator import TelemetryAggregator
+from .announcer import DiscoveryAnnouncer
 from .base import BaseSubscriber
+from .position import PositionPublisher
+from .position import Zone
+from .telemetry import TelemetryPublisher
 
 
 class MqttSubscriber(BaseSubscriber):
+    PORTNUMS = frozenset({"TELEMETRY_APP", "POSITION_APP"})
 
     def __init__(self, config: dict, mqtt_client: mqtt.Client):
         super().__init__(default_topic="meshtastic.receive")
 
-        if not mqtt_client or not mqtt_client.is_connected():
-            self.logger.error("mqtt client is not connected")
-            sys.exit(1)
+        mqtt_config = ConfigCheck(config, self.__class__.__name__, ["node_ids"], self.logger)
+
+        # the client may still be connecting, packets are skipped until it is
+        if not mqtt_client:
+            mqtt_config.fail("mqtt client is disabled")
+
+        self._mqtt_client = mqtt_client
+        self._node_ids = frozenset(id_.lower() for id_ in mqtt_config["node_ids"])
+        self._handlers = {
+            "TELEMETRY_APP": self._telemetry,
+            "POSITION_APP": self._position,
+        }
+
+        self._telemetry_publisher = TelemetryPublisher(
+            self._mqtt_client,
+            deadband=mqtt_config.get("deadband", {}, dict),
+            min_interval=mqtt_config.get("min_interval", 30, (int, float)),
+            heartbeat=mqtt_config.get("heartbeat", 600, (int, float)),
+            report_interval=mqtt_config.get("report_interval", 3600, (int, float)),
+            logger=self.logger
+        )
+        self._position_publisher = PositionPublisher(
+            self._mqtt_client,
+            max_interval=mqtt_config.get("position_max_interval", 3600, (int, float)),
+            min_distance=mqtt_config.get("position_min_distance", 25, (int, float)),
+            zones=self._read_zones(mqtt_config),
+            logger=self.logger
+        )
+
+        # telemetry is published every `aggregate_interval` seconds as last/min/max/mean instead of per packet
+        aggregate_interval = mqtt_config.get("aggregate_interval", 0, (int, float))
+        if aggregate_interval > 0:
+            self._aggregator = TelemetryAggregator(
+                self._publish_telemetry,
+                interval=aggregate_interval,
+                window=mqtt_config.get("aggregate_window", 64, int),
+                logger=self.logger
+            )
+            self._aggregator.start()
+        else:
+            self._aggregator = None
+
+        aggregate_sensors = self._aggregator is not None and mqtt_config.get("aggregate_sensors", False, bool)
+        if mqtt_config.get("discovery", True, bool):
+            self._announcer = DiscoveryAnnouncer(
+                self._mqtt_client,
+                state_path=mqtt_config.get("discovery_state", "discovery.json", str),
+                aggregates=TelemetryAggregator.STATS if aggregate_sensors else (),
+                logger=self.logger
+            )
         else:
-            self._mqtt_client = mqtt_client
+            self._announcer = None
 
-        mqtt_config = ConfigCheck(config, self.__class__.__name__, ["node_ids"], self.logger)
-        self._node_ids = [id_.lower() for id_ in mqtt_config["node_ids"]]
+    @staticmethod
+    def _read_zones(mqtt_config: ConfigCheck) -> List[Zone]:
+        zones = []
+        for name, zone in mqtt_config.get("zones", {}, dict).items():
+            try:
+                zones.append(Zone.create(name, float(zone["latitude"]), float(zone["longitude"]), float(zone["radius"])))
+
+            except (KeyError, TypeError, ValueError):
+                mqtt_config.fail(f"config error: zone '{name}' needs a numeric 'latitude', 'longitude' and 'radius'")
+
+        return zones
 
     @property
-    def node_ids(self):
-        return self._node_ids.copy()
+    def node_ids(self) -> FrozenSet[str]:
+        return self._node_ids
+
+    @property
+    def portnums(self) -> FrozenSet[str]:
+        return self.PORTNUMS
+
+    @property
+    def from_ids(self) -> FrozenSet[str]:
+        return self._node_ids
+
+    @property
+    def telemetry_publisher(self) -> TelemetryPublisher:
+        return self._telemetry_publisher
+
+    @property
+    def aggregator(self) -> TelemetryAggregator:
+        return self._aggregator
+
+    @property
+    def position_publisher(self) -> PositionPublisher:
+        return self._position_publisher
+
+    def close(self):
+        # samples collected since the last aggregate are published before the subscriber goes away
+        if self._aggregator is not None:
+            self._aggregator.stop()
+            self._aggregator.flush()
+
+    def _announce(self, group: str, node_id: str, values: dict = None):
+        if self._announcer is not None:
+            self._announcer.announce(group, node_id, values or ())
 
-    def _telemetry(self, packet: dict, interface: MeshInterface):
+    def _publish_telemetry(self, state_topic: str, values: dict):
+        if self._telemetry_publisher.publish(state_topic, values):
+            self.logger.info(f"updating {state_topic}")
+
+    def _update_telemetry(self, state_topic: str, values: dict, long_name: str):
+        if self._aggregator is not None:
+            self._aggregator.add(state_topic, values)
+
+        elif self._telemetry_publisher.publish(state_topic, values):
+            self.logger.info(f"{long_name} updating {state_topic}")
+
+    def _telemetry(self, packet: dict, interface: MeshInterface, from_id: str):
 
         telemetry = self.dict_get(packet, ["decoded", "telemetry"])
         if telemetry:
-            from_id = f'{packet["from"]:x}'
-            long_name = self.get_long_name(packet["fromId"], interface)
+            node_hex = f'{packet["from"]:x}'
+            long_name = self.get_long_name(from_id, interface)
 
             device_metrics = self.dict_get(telemetry, "deviceMetrics")
             if device_metrics:
-                state_topic = f"homeassistant/sensor/{from_id}_device_metrics/state"
-                payload = json.dumps(device_metrics, sort_keys=True)
-                self._mqtt_client.publish(state_topic, payload)
-
-                self.logger.info(f"{long_name} updating {state_topic}")
+                self._announce("device_metrics", node_hex, device_metrics)
+                state_topic = f"homeassistant/sensor/{node_hex}_device_metrics/state"
+                self._update_telemetry(state_topic, device_metrics, long_name)
 
             environment_metrics = self.dict_get(telemetry, "environmentMetrics")
             if environment_metrics:
-                state_topic = f"homeassistant/sensor/{from_id}_environment_metrics/state"
-                payload = json.dumps(environment_metrics, sort_keys=True)
-                self._mqtt_client.publish(state_topic, payload)
-
-                self.logger.info(f"{long_name} updating {state_topic}")
+                self._announce("environment_metrics", node_hex, environment_metrics)
+                state_topic = f"homeassistant/sensor/{node_hex}_environment_metrics/state"
+                self._update_telemetry(state_topic, environment_metrics, long_name)
 
             local_stats = self.dict_get(telemetry, "localStats")
             if local_stats:
-                state_topic = f"homeassistant/sensor/{from_id}_local_stats/state"
-                payload = json.dumps(local_stats, sort_keys=True)
-                self._mqtt_client.publish(state_topic, payload)
-
-                self.logger.info(f"{long_name} updating {state_topic}")
+                self._announce("local_stats", node_hex, local_stats)
+                state_topic = f"homeassistant/sensor/{node_hex}_local_stats/state"
+                self._update_telemetry(state_topic, local_stats, long_name)
 
-    @staticmethod
-    def _precision_to_meter(precision_bits: int) -> float:
-        # 10 14.5 mi 23335.49
-        # 11 7.3 mi 11748.2
-        # 12 3.6 mi 5793.64
-        # 13 1.8 mi 2896.82
-        # 14 4787 ft 1459.078
-        # 15 2382 ft 726.0336
-        # 16 1194 ft 363.9312
-        # 17 597 ft 181.966
-        # 18 299 ft 91.1352
-        # 19 148 ft 45.1104
-
-        # y = 2103253 - 641854 * x  + 78792.7 * x ^ 2 - 4852.927 * x ^ 3 + 149.7082 * x ^ 4 - 1.848088 * x ^ 5I
-        meter = 2103253
-        meter -= 641854 * precision_bits
-        meter += 78792.7 * (precision_bits ** 2)
-        meter -= 4852.927 * (precision_bits ** 3)
-        meter += 149.7082 * (precision_bits ** 4)
-        meter -= 1.848088 * (precision_bits ** 5)
-        return meter
-
-    def _position(self, packet: dict, interface: MeshInterface):
+    def _position(self, packet: dict, interface: MeshInterface, from_id: str):
         # https://www.home-assistant.io/integrations/device_tracker.mqtt/
-        from_id = f'{packet["from"]:x}'
-        long_name = self.get_long_name(packet["fromId"], interface)
+        node_hex = f'{packet["from"]:x}'
         position = self.dict_get(packet, ["decoded", "position"])
         if position and all(k in position for k in ["precisionBits", "latitude", "longitude"]):
-            state_topic = f"homeassistant/device_tracker/{from_id}_position/attributes"
-
-            precision_bits = position["precisionBits"]
-            gps_accuracy = self._precision_to_meter(precision_bits)
-            payload = {
-                "latitude": position["latitude"],
-                "longitude": position["longitude"],
-                "gps_accuracy": gps_accuracy
-            }
-            self.logger.info(f"{long_name} updating {state_topic}")
-            self._mqtt_client.publish(state_topic, json.dumps(payload, sort_keys=True))
+            self._announce("position", node_hex)
+            state_topic = f"homeassistant/device_tracker/{node_hex}_position/attributes"
+
+            if self._position_publisher.publish(
+                    state_topic,
+                    position["latitude"],
+                    position["longitude"],
+                    position["precisionBits"]
+            ):
+                long_name = self.get_long_name(from_id, interface)
+                self.logger.info(f"{long_name} updating {state_topic}")
 
     @staticmethod
     def get_long_name(from_id: str, interface: MeshInterface):
-        return interface.nodes.get(from_id, {}).get("user", {}).get("longName", from_id)
+        return node_directory.long_name(from_id, interface)
 
-    def __call__(self, packet: dict, interface: MeshInterface):
+    def route(self, packet: dict, interface: MeshInterface, portnum: str, from_id: str):
+        # the PacketRouter only hands over PORTNUMS packets from node_ids
+        if self._mqtt_client.is_connected():
+            self._handlers[portnum](packet, interface, from_id)
 
+    def __call__(self, packet: dict, interface: MeshInterface):
+        # subscribed without a PacketRouter, the packets are filtered here
         from_id = packet["fromId"]
-
-        if from_id in self._node_ids:
-            port_num = packet.get("decoded", {}).get("portnum", None)
-
-            match port_num:
-                case "TELEMETRY_APP":
-                    self._telemetry(packet, interface)
-
-                case "POSITION_APP":
-                    self._position(packet, interface)
+        portnum = packet.get("decoded", {}).get("portnum")
+        if from_id in self._node_ids and portnum in self.PORTNUMS and self._mqtt_client.is_connected():
+            self._handlers[portnum](packet, interface, from_id)
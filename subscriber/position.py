@@ -0,0 +1,142 @@
+import json
+import logging
+import math
+import time
+from logging import Logger
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import paho.mqtt.client as mqtt
+
+from metrics import metrics
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = 111320
+
+# positions are sent as 1e-7 degree integers with the low 32 - precisionBits bits cleared,
+# the error is half a cell: 2 ** (31 - bits) * 1e-7 degrees
+PRECISION_METERS = tuple(2 ** (31 - bits) * 1e-7 * METERS_PER_DEGREE for bits in range(33))
+
+
+def precision_to_meter(precision_bits: int) -> float:
+    return PRECISION_METERS[min(max(precision_bits, 0), 32)]
+
+
+def haversine(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Zone(NamedTuple):
+    name: str
+    latitude: float
+    longitude: float
+    radius: float
+    # bounding box half sizes in degrees, most zones are ruled out without a haversine
+    latitude_delta: float
+    longitude_delta: float
+
+    @classmethod
+    def create(cls, name: str, latitude: float, longitude: float, radius: float) -> "Zone":
+        latitude_delta = radius / METERS_PER_DEGREE
+        longitude_delta = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+        return cls(name, latitude, longitude, radius, latitude_delta, longitude_delta)
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        if abs(latitude - self.latitude) > self.latitude_delta:
+            return False
+
+        if abs(longitude - self.longitude) > self.longitude_delta:
+            return False
+
+        return haversine(self.latitude, self.longitude, latitude, longitude) <= self.radius
+
+
+class PositionPublisher:
+    NOT_HOME = "not_home"
+
+    def __init__(
+            self,
+            mqtt_client: mqtt.Client,
+            max_interval: float = 0,
+            min_distance: float = 0,
+            zones: List[Zone] = (),
+            logger: Logger = None
+    ):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._mqtt_client = mqtt_client
+        self._max_interval = max_interval
+        self._min_distance = min_distance
+        self._zones = tuple(zones)
+
+        # state topic -> (latitude, longitude, publish time, zone)
+        self._last: Dict[str, Tuple[float, float, float, Optional[Zone]]] = {}
+
+        self._metric_published = metrics.counter("mqtt_publish_total", "mqtt state publishes", group="position")
+        self._metric_suppressed = metrics.counter(
+            "mqtt_suppressed_total", "mqtt state publishes suppressed", group="position"
+        )
+        self._metric_zone_changes = metrics.counter("position_zone_changes_total", "nodes entering or leaving zones")
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    @property
+    def zones(self) -> Tuple[Zone, ...]:
+        return self._zones
+
+    def locate(self, latitude: float, longitude: float, current: Optional[Zone] = None) -> Optional[Zone]:
+        # a node usually stays where it was, its current zone is checked first
+        if current is not None and current.contains(latitude, longitude):
+            return current
+
+        for zone in self._zones:
+            if zone is not current and zone.contains(latitude, longitude):
+                return zone
+
+        return None
+
+    def publish(self, state_topic: str, latitude: float, longitude: float, precision_bits: int) -> bool:
+        now = time.monotonic()
+        accuracy = precision_to_meter(precision_bits)
+        last = self._last.get(state_topic)
+
+        if last is None:
+            zone = self.locate(latitude, longitude)
+
+        else:
+            last_latitude, last_longitude, published_at, last_zone = last
+            zone = self.locate(latitude, longitude, last_zone) if self._zones else None
+            if zone is not last_zone:
+                self._metric_zone_changes.inc()
+                self.logger.info(
+                    f"{state_topic} left {last_zone.name if last_zone else self.NOT_HOME}, "
+                    f"entered {zone.name if zone else self.NOT_HOME}"
+                )
+
+            # a stationary node reporting its position again, the fix moved less than its own accuracy or the
+            # gps jitter floor, a full precision position is accurate to millimeters but wanders by meters
+            elif haversine(last_latitude, last_longitude, latitude, longitude) < max(accuracy, self._min_distance):
+                if not self._max_interval or now - published_at < self._max_interval:
+                    self._metric_suppressed.inc()
+                    return False
+
+        payload = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "gps_accuracy": accuracy
+        }
+        if self._zones:
+            payload["zone"] = zone.name if zone else self.NOT_HOME
+
+        self._mqtt_client.publish(state_topic, json.dumps(payload, sort_keys=True))
+        self._last[state_topic] = (latitude, longitude, now, zone)
+        self._metric_published.inc()
+        return True
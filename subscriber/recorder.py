@@ -0,0 +1,76 @@
+import base64
+import json
+import threading
+import time
+
+from meshtastic.mesh_interface import MeshInterface
+from pubsub import pub
+
+from config_check import ConfigCheck
+from .base import BaseSubscriber
+
+
+class RecorderSubscriber(BaseSubscriber):
+    BYTES_KEY = "__bytes__"
+
+    def __init__(self, config: dict):
+        super().__init__(default_topic="meshtastic.receive")
+
+        recorder_config = ConfigCheck(config, self.__class__.__name__, None, self.logger)
+        self._path = recorder_config.get("path", "packets.jsonl", str)
+
+        self._lock = threading.Lock()
+        self._fd = open(self._path, "a", encoding="utf-8")
+        self._recorded = 0
+
+        self.logger.info(f"recording packets to {self._path}")
+
+    @property
+    def recorded(self) -> int:
+        return self._recorded
+
+    @classmethod
+    def encode(cls, value):
+        # packets are plain dicts apart from raw protobufs and byte payloads
+        if isinstance(value, dict):
+            return {k: cls.encode(v) for k, v in value.items() if k != "raw"}
+
+        if isinstance(value, (list, tuple)):
+            return [cls.encode(v) for v in value]
+
+        if isinstance(value, bytes):
+            return {cls.BYTES_KEY: base64.b64encode(value).decode("ascii")}
+
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+
+        return str(value)
+
+    @classmethod
+    def decode(cls, value):
+        if isinstance(value, dict):
+            if len(value) == 1 and cls.BYTES_KEY in value:
+                return base64.b64decode(value[cls.BYTES_KEY])
+
+            return {k: cls.decode(v) for k, v in value.items()}
+
+        if isinstance(value, list):
+            return [cls.decode(v) for v in value]
+
+        return value
+
+    def close(self):
+        with self._lock:
+            self._fd.close()
+
+    def __call__(self, packet: dict, interface: MeshInterface, topic=pub.AUTO_TOPIC):
+        line = json.dumps({
+            "time": time.time(),
+            "topic": topic.getName(),
+            "packet": self.encode(packet),
+        })
+
+        with self._lock:
+            self._fd.write(line + "\n")
+            self._fd.flush()
+            self._recorded += 1
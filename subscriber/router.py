@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from meshtastic.mesh_interface import MeshInterface
+
+from config_check import ConfigCheck
+from metrics import Counter
+from metrics import metrics
+from .base import BaseSubscriber
+
+
+class RoutingTable:
+    __slots__ = ("_subscribers", "_exact", "_by_portnum", "_by_from_id", "_default")
+
+    def __init__(self, subscribers: List[BaseSubscriber]):
+        self._subscribers = list(subscribers)
+
+        portnums = set().union(*(s.portnums for s in subscribers if s.portnums is not None))
+        from_ids = set().union(*(s.from_ids for s in subscribers if s.from_ids is not None))
+
+        # every lookup is one or two dict gets, the subscribers' sets are only consulted here
+        self._exact: Dict[Tuple[str, str], Tuple[BaseSubscriber, ...]] = {
+            (portnum, from_id): self._match(portnum, from_id)
+            for portnum in portnums for from_id in from_ids
+        }
+        # portnums no subscriber names fall through to the subscribers taking any portnum
+        self._by_portnum = {portnum: self._match(portnum, None) for portnum in portnums}
+        self._by_from_id = {from_id: self._match(None, from_id) for from_id in from_ids}
+        self._default = self._match(None, None)
+
+    def _match(self, portnum: Optional[str], from_id: Optional[str]) -> Tuple[BaseSubscriber, ...]:
+        # None stands for a portnum or sender no subscriber asked for by name
+        return tuple(
+            s for s in self._subscribers
+            if (s.portnums is None or portnum in s.portnums) and (s.from_ids is None or from_id in s.from_ids)
+        )
+
+    @property
+    def subscribers(self) -> List[BaseSubscriber]:
+        return list(self._subscribers)
+
+    @property
+    def size(self) -> int:
+        return len(self._exact) + len(self._by_portnum) + len(self._by_from_id) + 1
+
+    def lookup(self, portnum: Optional[str], from_id: Optional[str]) -> Tuple[BaseSubscriber, ...]:
+        handlers = self._exact.get((portnum, from_id))
+        if handlers is None:
+            handlers = self._by_portnum.get(portnum)
+            if handlers is None:
+                handlers = self._by_from_id.get(from_id, self._default)
+
+        return handlers
+
+
+class PacketRouter(BaseSubscriber):
+
+    def __init__(self, config: dict, subscribers: List[BaseSubscriber]):
+        super().__init__(default_topic="meshtastic.receive")
+
+        config_check = ConfigCheck(config, self.__class__.__name__, None, self.logger, optional=True)
+        self._window = config_check.get("window", 600, (int, float))
+        self._max_size = config_check.get("max_size", 4096, int)
+        if self._max_size <= 0:
+            config_check.fail(f"config error: 'max_size' must be positive")
+
+        # replaced as a whole so a reload never mixes the routes of two configs
+        self._table = RoutingTable(subscribers)
+
+        # (from, packet id) -> first seen, oldest first, shared by the reader threads of every radio
+        self._seen: OrderedDict[Tuple[int, int], float] = OrderedDict()
+        self._seen_lock = threading.Lock()
+
+        # portnum -> packets routed
+        self._metric_routed: Dict[Optional[str], Counter] = {}
+        self._metric_suppressed = metrics.counter("dedupe_suppressed_total", "duplicate packets suppressed")
+        metrics.gauge("dedupe_tracked", "packet ids in the dedupe window", lambda: len(self._seen))
+
+        names = ", ".join(s.__class__.__name__ for s in subscribers)
+        self.logger.info(f"routing {self._table.size} routes, deduplicating within {self._window}s, for {names}")
+
+    @property
+    def subscribers(self) -> List[BaseSubscriber]:
+        return self._table.subscribers
+
+    def swap(self, subscribers: List[BaseSubscriber]) -> List[BaseSubscriber]:
+        previous, self._table = self._table, RoutingTable(subscribers)
+
+        names = ", ".join(s.__class__.__name__ for s in subscribers)
+        self.logger.info(f"routing {self._table.size} routes for {names}")
+        return previous.subscribers
+
+    @property
+    def suppressed(self) -> int:
+        return int(self._metric_suppressed.value)
+
+    def is_duplicate(self, packet: dict) -> bool:
+        packet_id = packet.get("id")
+        if not packet_id:
+            return False
+
+        now = time.monotonic()
+        key = (packet.get("from"), packet_id)
+        with self._seen_lock:
+            seen = self._seen
+            while seen:
+                first_seen = next(iter(seen.values()))
+                if now - first_seen < self._window and len(seen) < self._max_size:
+                    break
+
+                seen.popitem(last=False)
+
+            if key in seen:
+                return True
+
+            seen[key] = now
+            return False
+
+    def _count(self, portnum: Optional[str]):
+        counter = self._metric_routed.get(portnum)
+        if counter is None:
+            counter = metrics.counter("router_packets_total", "packets routed", portnum=portnum or "none")
+            self._metric_routed[portnum] = counter
+
+        counter.inc()
+
+    def __call__(self, packet: dict, interface: MeshInterface):
+        # nothing raised here reaches the radio's reader thread
+        try:
+            duplicate = self.is_duplicate(packet)
+
+        except Exception:
+            self.logger.exception(f"failed to check packet {packet.get('id')} for duplicates")
+            return
+
+        if duplicate:
+            self._metric_suppressed.inc()
+            self.logger.debug(f"suppressed duplicate {packet.get('id')} from {packet.get('fromId')}")
+            return
+
+        decoded = packet.get("decoded")
+        portnum = decoded.get("portnum") if decoded else None
+        self._count(portnum)
+
+        from_id = packet.get("fromId")
+        for subscriber in self._table.lookup(portnum, from_id):
+            try:
+                subscriber.route(packet, interface, portnum, from_id)
+
+            except Exception:
+                subscriber.logger.exception(f"failed to handle packet {packet.get('id')}")
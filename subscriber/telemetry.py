@@ -0,0 +1,127 @@
+import json
+import logging
+import math
+import time
+from logging import Logger
+
+import paho.mqtt.client as mqtt
+
+from metrics import metrics
+from .aggregator import TelemetryAggregator
+
+
+class TelemetryPublisher:
+    # fields that change on every packet but no sensor is built on
+    DEFAULT_DEADBAND = {
+        "uptimeSeconds": math.inf,
+    }
+
+    def __init__(
+            self,
+            mqtt_client: mqtt.Client,
+            deadband: dict = None,
+            min_interval: float = 0,
+            heartbeat: float = 0,
+            report_interval: float = 0,
+            logger: Logger = None
+    ):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._mqtt_client = mqtt_client
+
+        self._deadband = dict(self.DEFAULT_DEADBAND)
+        self._deadband.update(deadband or {})
+        self._min_interval = min_interval
+        self._heartbeat = heartbeat
+        self._report_interval = report_interval
+
+        # state topic -> (last published values, publish time)
+        self._last = {}
+
+        self._published = 0
+        self._unchanged = 0
+        self._throttled = 0
+        self._report_time = time.monotonic()
+        self._report_published = 0
+
+        self._metric_published = metrics.counter("mqtt_publish_total", "mqtt state publishes", group="telemetry")
+        self._metric_suppressed = metrics.counter(
+            "mqtt_suppressed_total", "mqtt state publishes suppressed", group="telemetry"
+        )
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    def _field_deadband(self, field: str) -> float:
+        deadband = self._deadband.get(field)
+        if deadband is None:
+            # aggregates like voltage_mean share the deadband of the field they summarize
+            base, _, stat = field.rpartition("_")
+            deadband = self._deadband.get(base, 0) if stat in TelemetryAggregator.STATS else 0
+            self._deadband[field] = deadband
+
+        return deadband
+
+    def _changed(self, previous: dict, values: dict) -> bool:
+        if previous.keys() != values.keys():
+            return True
+
+        for field, value in values.items():
+            last = previous[field]
+            if isinstance(value, (int, float)) and isinstance(last, (int, float)):
+                if abs(value - last) > self._field_deadband(field):
+                    return True
+
+            elif value != last:
+                return True
+
+        return False
+
+    def publish(self, state_topic: str, values: dict) -> bool:
+        now = time.monotonic()
+        last = self._last.get(state_topic)
+
+        if last is not None:
+            previous, published_at = last
+            age = now - published_at
+            if not self._changed(previous, values):
+                if not self._heartbeat or age < self._heartbeat:
+                    self._unchanged += 1
+                    self._metric_suppressed.inc()
+                    self._report(now)
+                    return False
+
+            elif age < self._min_interval:
+                self._throttled += 1
+                self._metric_suppressed.inc()
+                self._report(now)
+                return False
+
+        self._mqtt_client.publish(state_topic, json.dumps(values, sort_keys=True))
+        self._last[state_topic] = (dict(values), now)
+        self._published += 1
+        self._metric_published.inc()
+        self._report(now)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._last),
+            "published": self._published,
+            "unchanged": self._unchanged,
+            "throttled": self._throttled,
+        }
+
+    def _report(self, now: float):
+        elapsed = now - self._report_time
+        if not self._report_interval or elapsed < self._report_interval:
+            return
+
+        rate = (self._published - self._report_published) / elapsed * 60
+        stats = self.stats()
+        self.logger.info(
+            f"telemetry: {rate:.1f} publish/min, published {stats['published']}, "
+            f"suppressed {stats['unchanged']} unchanged, {stats['throttled']} throttled"
+        )
+        self._report_time = now
+        self._report_published = self._published
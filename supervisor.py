@@ -0,0 +1,228 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from logging import Logger
+from typing import Callable
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+from meshtastic.mesh_interface import MeshInterface
+from pubsub import pub
+
+from config_check import ConfigCheck
+from metrics import metrics
+
+
+class Backoff:
+
+    def __init__(self, initial: float, maximum: float, multiplier: float = 2.0, jitter: float = 0.5):
+        self._initial = initial
+        self._maximum = maximum
+        self._multiplier = multiplier
+        self._jitter = jitter
+        self._attempt = 0
+
+    def reset(self):
+        self._attempt = 0
+
+    def next(self) -> float:
+        # the jittered part keeps several clients from retrying in lockstep
+        delay = min(self._maximum, self._initial * self._multiplier ** self._attempt)
+        self._attempt += 1
+        return delay * (1 - self._jitter) + random.uniform(0, delay * self._jitter)
+
+
+class LinkMonitor:
+
+    def __init__(self, name: str, logger: Logger = None):
+        self._name = name
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._up = False
+        # None until the first connection, startup is not downtime
+        self._down_since = None
+
+        self._metric_disconnects = metrics.counter("link_disconnects_total", "link disconnects", link=name)
+        self._metric_downtime = metrics.counter("link_downtime_seconds_total", "seconds spent disconnected", link=name)
+        self._metric_reconnect = metrics.histogram("link_reconnect_seconds", "time to reconnect", link=name)
+        metrics.gauge("link_up", "1 while the link is connected", lambda: int(self._up), link=name)
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    @property
+    def up(self) -> bool:
+        return self._up
+
+    def connected(self):
+        with self._lock:
+            if self._up:
+                return
+
+            down_since, self._up = self._down_since, True
+
+        if down_since is not None:
+            downtime = time.monotonic() - down_since
+            self._metric_downtime.inc(downtime)
+            self._metric_reconnect.observe(downtime)
+            self.logger.info(f"{self._name} reconnected after {downtime:.2f}s")
+
+    def disconnected(self):
+        with self._lock:
+            if not self._up:
+                return
+
+            self._up = False
+            self._down_since = time.monotonic()
+
+        self._metric_disconnects.inc()
+        self.logger.warning(f"{self._name} disconnected")
+
+
+class Supervisor:
+
+    def __init__(self, config: dict, logger: Logger = None):
+        self._logger = logger or logging.getLogger(self.__class__.__name__)
+
+        config_check = ConfigCheck(config, "Supervisor", None, self.logger, optional=True)
+        self._initial_delay = config_check.get("initial_delay", 0.25, (int, float))
+        self._max_delay = config_check.get("max_delay", 60, (int, float))
+        self._jitter = config_check.get("jitter", 0.5, (int, float))
+        if self._initial_delay <= 0 or self._max_delay < self._initial_delay or not 0 <= self._jitter <= 1:
+            config_check.fail("config error: expected 0 < 'initial_delay' <= 'max_delay' and 0 <= 'jitter' <= 1")
+
+        self._stable_after = config_check.get("stable_after", 10, (int, float))
+        if self._stable_after < 0:
+            config_check.fail("config error: 'stable_after' must not be negative")
+
+    @property
+    def logger(self) -> Logger:
+        return self._logger
+
+    def backoff(self) -> Backoff:
+        return Backoff(self._initial_delay, self._max_delay, jitter=self._jitter)
+
+
+class RadioSupervisor(Supervisor):
+
+    def __init__(self, config: dict, connect: Callable[[], MeshInterface], name: str = "radio", logger: Logger = None):
+        super().__init__(config, logger)
+        self._name = name
+        self._connect = connect
+        self._backoff = self.backoff()
+        self._link = LinkMonitor(name, self.logger)
+
+        self._interface: Optional[MeshInterface] = None
+        self._lost = threading.Event()
+        self._stop_event = threading.Event()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def interface(self) -> Optional[MeshInterface]:
+        return self._interface
+
+    @property
+    def link(self) -> LinkMonitor:
+        return self._link
+
+    def pubsub_subscribe(self):
+        pub.subscribe(self._on_connection_lost, "meshtastic.connection.lost")
+
+    def _on_connection_lost(self, interface: MeshInterface):
+        if interface is self._interface:
+            self._lost.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._lost.set()
+
+    def close(self):
+        interface, self._interface = self._interface, None
+        if interface is not None:
+            try:
+                interface.close()
+
+            except Exception as e:
+                self.logger.debug(f"failed to close interface: {e!r}")
+
+    def run(self, pending: Future = None):
+        while not self._stop_event.is_set():
+            try:
+                interface = pending.result() if pending is not None else self._connect()
+
+            except Exception as e:
+                pending = None
+                delay = self._backoff.next()
+                self.logger.warning(f"{self._name} failed to connect: {e!r}, retrying in {delay:.2f}s")
+                self._stop_event.wait(delay)
+                continue
+
+            pending = None
+
+            self._lost.clear()
+            self._interface = interface
+            connected_at = time.monotonic()
+            if interface.isConnected.is_set():
+                self._link.connected()
+                self.logger.info(f"{self._name} connected to {interface.getShortName()} {interface.getLongName()}")
+                self._lost.wait()
+
+            if self._stop_event.is_set():
+                self.close()
+                break
+
+            self._link.disconnected()
+            self.close()
+
+            # reconnect right away after a link that stayed up, a USB hiccup is usually over by the time the port is
+            # reopened, a port that keeps dropping right after opening backs off like a failed connect
+            uptime = time.monotonic() - connected_at
+            if uptime >= self._stable_after:
+                self._backoff.reset()
+                continue
+
+            delay = self._backoff.next()
+            self.logger.warning(f"{self._name} dropped after {uptime:.2f}s, reconnecting in {delay:.2f}s")
+            self._stop_event.wait(delay)
+
+
+class MqttSupervisor(Supervisor):
+
+    def __init__(self, config: dict, mqtt_client: mqtt.Client, name: str = "mqtt", logger: Logger = None):
+        super().__init__(config, logger)
+        self._mqtt_client = mqtt_client
+        self._link = LinkMonitor(name, self.logger)
+        self._connected = threading.Event()
+
+        # paho reconnects from its network thread, its backoff doubles up to max_delay without jitter
+        mqtt_client.reconnect_delay_set(min_delay=self._initial_delay, max_delay=self._max_delay)
+        mqtt_client.on_connect = self._on_connect
+        mqtt_client.on_disconnect = self._on_disconnect
+
+    @property
+    def connected(self) -> threading.Event:
+        return self._connected
+
+    @property
+    def link(self) -> LinkMonitor:
+        return self._link
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            self.logger.error(f"mqtt broker refused connection: {reason_code}")
+            return
+
+        self._connected.set()
+        self._link.connected()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._connected.clear()
+        self._link.disconnected()
+        if reason_code.is_failure:
+            self.logger.warning(f"mqtt broker disconnected: {reason_code}")
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Hashable
+from typing import Optional
+from typing import Tuple
+
+
+class TtlCache:
+
+    def __init__(self, ttl: float, max_size: int):
+        self._ttl = ttl
+        self._max_size = max(1, max_size)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def evictions(self) -> int:
+        return self._evictions
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        # returns (value, fresh), expired entries are kept until evicted so
+        # callers can revalidate them instead of refetching
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            value, expires = entry
+            if expires > now:
+                self._hits += 1
+                return value, True
+
+            self._misses += 1
+            return value, False
+
+    def get(self, key: Hashable, default=None):
+        entry = self.lookup(key)
+        if entry is not None and entry[1]:
+            return entry[0]
+
+        return default
+
+    def put(self, key: Hashable, value, ttl: float = None):
+        expires = time.monotonic() + (self._ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "size": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }